@@ -0,0 +1,287 @@
+"""
+告警规则引擎 - 在轮询流程中逐样本增量评估告警规则
+"""
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+from config import (
+    ALERT_TEMP_HIGH, ALERT_TEMP_CLEAR, ALERT_FAN_MIN_RPM,
+    ALERT_HASHRATE_DROP_RATIO, ALERT_HASHRATE_CLEAR_RATIO, ALERT_HASHRATE_EWMA_ALPHA,
+    ALERT_OPEN_AFTER, ALERT_CLOSE_AFTER, ALERT_FLAP_WINDOW, ALERT_FLAP_THRESHOLD
+)
+
+# 规则检查结果：(是否异常, 观测值, 描述)；返回None表示样本中没有该规则需要的数据
+CheckResult = Optional[Tuple[bool, Optional[float], str]]
+
+class RuleState:
+    """单台矿机单条规则的状态（迟滞计数）"""
+
+    __slots__ = ("active", "bad_count", "good_count")
+
+    def __init__(self):
+        self.active = False
+        self.bad_count = 0
+        self.good_count = 0
+
+class MinerAlertState:
+    """单台矿机的增量状态，所有字段大小固定，保证每个样本的评估开销有界"""
+
+    def __init__(self):
+        self.rules: Dict[str, RuleState] = {}
+        self.hashrate_baseline: Optional[float] = None
+        # 已安装的风扇位（位掩码，-1 表示全部槽位），未安装风扇的槽位一直为0，不参与故障判断
+        self.fans_present = 0
+        self.last_online: Optional[bool] = None
+        self.transitions: Deque[bool] = deque(maxlen=ALERT_FLAP_WINDOW)
+        self.transition_count = 0
+
+class AlertRule:
+    """告警规则基类"""
+
+    name = ""
+    severity = "WARNING"
+
+    def __init__(self, open_after: int = ALERT_OPEN_AFTER, close_after: int = ALERT_CLOSE_AFTER):
+        self.open_after = open_after
+        self.close_after = close_after
+
+    def check(self, sample: Dict, state: MinerAlertState, active: bool) -> CheckResult:
+        """检查样本，active表示告警当前是否已打开（用于迟滞阈值）"""
+        raise NotImplementedError
+
+    def restore(self, state: MinerAlertState):
+        """从数据库恢复打开的告警时调用，用于恢复规则需要的内存状态"""
+
+class OfflineRule(AlertRule):
+    """矿机离线"""
+
+    name = "offline"
+    severity = "ERROR"
+
+    def check(self, sample: Dict, state: MinerAlertState, active: bool) -> CheckResult:
+        if sample.get("is_online"):
+            return False, None, "矿机恢复在线"
+        return True, None, "矿机离线"
+
+class OverTemperatureRule(AlertRule):
+    """过温（阈值规则，带恢复阈值）"""
+
+    name = "over_temperature"
+    severity = "ERROR"
+
+    def __init__(self, high: float = ALERT_TEMP_HIGH, clear: float = ALERT_TEMP_CLEAR, **kwargs):
+        super().__init__(**kwargs)
+        self.high = high
+        self.clear = clear
+
+    def check(self, sample: Dict, state: MinerAlertState, active: bool) -> CheckResult:
+        temps = [
+            sample.get(key) for key in ("temp_max", "temp_chip", "temp_pcb")
+            if isinstance(sample.get(key), (int, float))
+        ]
+        if not temps:
+            return None
+        temp = max(temps)
+        threshold = self.clear if active else self.high
+        return temp > threshold, temp, f"温度 {temp:.1f}℃（阈值 {self.high:.0f}℃）"
+
+class FanFailureRule(AlertRule):
+    """风扇故障（已安装的风扇转速低于下限）
+
+    部分固件把未安装风扇的槽位报告为0。矿机报告了风扇数（fan_count）时按风扇数确定已安装的槽位，
+    否则只有见过转速达到下限的槽位才视为已安装。
+    """
+
+    name = "fan_failure"
+    severity = "ERROR"
+
+    def __init__(self, min_rpm: int = ALERT_FAN_MIN_RPM, **kwargs):
+        super().__init__(**kwargs)
+        self.min_rpm = min_rpm
+
+    def check(self, sample: Dict, state: MinerAlertState, active: bool) -> CheckResult:
+        if not sample.get("is_online"):
+            return None
+        fan_count = sample.get("fan_count")
+        if isinstance(fan_count, int) and fan_count > 0:
+            state.fans_present = (1 << fan_count) - 1
+        speeds = []
+        for slot, speed in enumerate(sample.get("fan_speeds") or []):
+            if not isinstance(speed, (int, float)):
+                continue
+            if speed >= self.min_rpm:
+                state.fans_present |= 1 << slot
+            if state.fans_present & (1 << slot):
+                speeds.append(speed)
+        if not speeds:
+            return None
+        slowest = min(speeds)
+        return slowest < self.min_rpm, slowest, f"风扇最低转速 {slowest:.0f} RPM"
+
+    def restore(self, state: MinerAlertState):
+        # 重启后不知道哪些风扇转动过，故障风扇可能一直是0，全部槽位都参与判断，避免告警被误关闭
+        state.fans_present = -1
+
+class HashrateDropRule(AlertRule):
+    """算力下降（相对指数平滑基线的变化率）"""
+
+    name = "hashrate_drop"
+    severity = "WARNING"
+
+    def __init__(self, drop_ratio: float = ALERT_HASHRATE_DROP_RATIO,
+                 clear_ratio: float = ALERT_HASHRATE_CLEAR_RATIO,
+                 alpha: float = ALERT_HASHRATE_EWMA_ALPHA, **kwargs):
+        super().__init__(**kwargs)
+        self.drop_ratio = drop_ratio
+        self.clear_ratio = clear_ratio
+        self.alpha = alpha
+
+    def check(self, sample: Dict, state: MinerAlertState, active: bool) -> CheckResult:
+        hashrate = sample.get("hashrate")
+        if hashrate is None:
+            hashrate = sample.get("hashrate_5s")
+        if not sample.get("is_online") or not isinstance(hashrate, (int, float)):
+            return None
+
+        baseline = state.hashrate_baseline
+        if baseline is None:
+            state.hashrate_baseline = float(hashrate)
+            return None
+
+        ratio = self.clear_ratio if active else self.drop_ratio
+        is_bad = baseline > 0 and hashrate < baseline * (1 - ratio)
+        # 告警期间冻结基线，避免基线被低算力拉低后告警自行消失
+        if not is_bad:
+            state.hashrate_baseline = baseline + self.alpha * (hashrate - baseline)
+        return is_bad, hashrate, f"算力 {hashrate:.2f} TH/s（基线 {baseline:.2f} TH/s）"
+
+class PoolFailoverRule(AlertRule):
+    """矿池故障切换（主矿池不可用）"""
+
+    name = "pool_failover"
+    severity = "WARNING"
+
+    def check(self, sample: Dict, state: MinerAlertState, active: bool) -> CheckResult:
+        pools = sample.get("pool_info") or []
+        if not sample.get("is_online") or not pools:
+            return None
+        primary = min(pools, key=lambda p: p.get("priority") or 0)
+        if primary.get("status") == "Alive":
+            return False, None, f"主矿池恢复: {primary.get('url')}"
+        return True, None, f"主矿池不可用: {primary.get('url')}"
+
+class FlappingRule(AlertRule):
+    """在线状态抖动（窗口内在线/离线切换次数过多）"""
+
+    name = "flapping"
+    severity = "WARNING"
+
+    def __init__(self, threshold: int = ALERT_FLAP_THRESHOLD, **kwargs):
+        kwargs.setdefault("open_after", 1)
+        kwargs.setdefault("close_after", 1)
+        super().__init__(**kwargs)
+        self.threshold = threshold
+
+    def check(self, sample: Dict, state: MinerAlertState, active: bool) -> CheckResult:
+        is_online = bool(sample.get("is_online"))
+        changed = state.last_online is not None and is_online != state.last_online
+        state.last_online = is_online
+
+        # 维护滑动窗口内的切换计数，O(1)
+        if len(state.transitions) == state.transitions.maxlen and state.transitions[0]:
+            state.transition_count -= 1
+        state.transitions.append(changed)
+        if changed:
+            state.transition_count += 1
+
+        count = state.transition_count
+        threshold = max(1, self.threshold // 2) if active else self.threshold
+        return count >= threshold, float(count), f"最近 {len(state.transitions)} 次采样内状态切换 {count} 次"
+
+def default_rules() -> List[AlertRule]:
+    """默认规则集"""
+    return [
+        OfflineRule(),
+        FlappingRule(),
+        OverTemperatureRule(),
+        FanFailureRule(),
+        HashrateDropRule(),
+        PoolFailoverRule(),
+    ]
+
+class AlertEngine:
+    """告警引擎：逐样本评估规则，只在告警打开和关闭时产生事件"""
+
+    def __init__(self, rules: Optional[List[AlertRule]] = None):
+        self.rules = rules if rules is not None else default_rules()
+        self._states: Dict[int, MinerAlertState] = {}
+
+    def _state(self, miner_id: int) -> MinerAlertState:
+        state = self._states.get(miner_id)
+        if state is None:
+            state = MinerAlertState()
+            for rule in self.rules:
+                state.rules[rule.name] = RuleState()
+            self._states[miner_id] = state
+        return state
+
+    def restore(self, miner_id: int, rule_name: str):
+        """恢复数据库中未关闭的告警，避免重启后重复打开"""
+        state = self._state(miner_id)
+        if rule_name in state.rules:
+            state.rules[rule_name].active = True
+            for rule in self.rules:
+                if rule.name == rule_name:
+                    rule.restore(state)
+
+    def forget(self, miner_id: int):
+        """丢弃矿机的状态"""
+        self._states.pop(miner_id, None)
+
+    def active_rules(self, miner_id: int) -> List[str]:
+        """获取矿机当前打开的告警规则"""
+        state = self._states.get(miner_id)
+        if state is None:
+            return []
+        return [name for name, rs in state.rules.items() if rs.active]
+
+    def evaluate(self, miner_id: int, sample: Dict, timestamp: Optional[datetime] = None) -> List[Dict]:
+        """评估一个样本，返回状态发生变化的告警事件"""
+        state = self._state(miner_id)
+        timestamp = timestamp or datetime.utcnow()
+        events = []
+
+        for rule in self.rules:
+            rule_state = state.rules[rule.name]
+            result = rule.check(sample, state, rule_state.active)
+            if result is None:
+                continue
+            is_bad, value, message = result
+
+            if is_bad:
+                rule_state.bad_count += 1
+                rule_state.good_count = 0
+            else:
+                rule_state.good_count += 1
+                rule_state.bad_count = 0
+
+            if not rule_state.active and rule_state.bad_count >= rule.open_after:
+                rule_state.active = True
+                event_type = "open"
+            elif rule_state.active and rule_state.good_count >= rule.close_after:
+                rule_state.active = False
+                event_type = "close"
+            else:
+                continue
+
+            events.append({
+                "type": event_type,
+                "miner_id": miner_id,
+                "rule": rule.name,
+                "severity": rule.severity,
+                "value": value,
+                "message": message,
+                "timestamp": timestamp,
+            })
+
+        return events
@@ -0,0 +1,69 @@
+"""
+序列化基准测试 - 对比矿机详情24小时历史的载荷大小和序列化耗时
+
+用法: python benchmark_serialization.py [样本数]
+"""
+import gzip
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+import responses
+from responses import dumps
+
+HISTORY_FIELDS = ("timestamp", "temp_chip", "temp_pcb", "hashrate", "power_consumption")
+
+def make_history(count: int):
+    """生成模拟的历史数据行（与数据库查询返回的元组结构一致）"""
+    start = datetime.utcnow() - timedelta(days=1)
+    return [(
+        start + timedelta(seconds=60 * i),
+        round(random.uniform(60, 80), 2),
+        round(random.uniform(50, 70), 2),
+        round(random.uniform(130, 140), 3),
+        round(random.uniform(3000, 3300), 1),
+    ) for i in range(count)]
+
+def legacy_rows(history):
+    """原实现：逐行 isoformat 构造字典，经 jsonable_encoder 和标准库 json 输出"""
+    content = [{
+        "timestamp": row[0].isoformat(),
+        "temp_chip": row[1],
+        "temp_pcb": row[2],
+        "hashrate": row[3],
+        "power_consumption": row[4]
+    } for row in history]
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False).encode("utf-8")
+
+def fast_rows(history):
+    """新实现：行格式，直接序列化"""
+    return dumps([dict(zip(HISTORY_FIELDS, row)) for row in history])
+
+def fast_columnar(history):
+    """新实现：列格式"""
+    return dumps({name: [row[i] for row in history] for i, name in enumerate(HISTORY_FIELDS)})
+
+def measure(func, history, repeat: int = 20):
+    """返回 (输出, 平均耗时毫秒)"""
+    body = func(history)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(history)
+    return body, (time.perf_counter() - start) * 1000 / repeat
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1440
+    history = make_history(count)
+
+    print(f"样本数: {count}  orjson: {'是' if responses.orjson else '否'}  brotli: {'是' if responses.brotli else '否'}")
+    print(f"{'格式':<16}{'序列化(ms)':>12}{'原始(KB)':>12}{'gzip(KB)':>12}{'br(KB)':>12}")
+    for name, func in (("legacy rows", legacy_rows), ("fast rows", fast_rows), ("fast columnar", fast_columnar)):
+        body, elapsed = measure(func, history)
+        gzip_size = len(gzip.compress(body, compresslevel=5)) / 1024
+        br_size = f"{len(responses.compress(body, 'br')) / 1024:.1f}" if responses.brotli else "-"
+        print(f"{name:<16}{elapsed:>12.2f}{len(body) / 1024:>12.1f}{gzip_size:>12.1f}{br_size:>12}")
+
+if __name__ == "__main__":
+    main()
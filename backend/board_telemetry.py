@@ -0,0 +1,148 @@
+"""
+算力板遥测查询 - 全矿场算力板健康趋势和退化检测（聚合全部在SQL中完成）
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import Integer, and_, case, cast, func, or_
+from sqlalchemy.orm import Session
+from config import BOARD_HASHRATE_DROP, BOARD_TEMP_LIMIT, BOARD_HW_ERROR_DELTA
+from database import Miner, HashboardStatus
+
+def board_trend(db: Session, hours: int = 24, bucket_seconds: int = 3600,
+                model: Optional[str] = None) -> List[Dict]:
+    """全矿场算力板趋势：按时间桶统计板数、温度、平均算力、最少芯片数"""
+    since = datetime.utcnow() - timedelta(hours=hours)
+    epoch = cast(func.strftime("%s", HashboardStatus.timestamp), Integer)
+    bucket = (epoch // bucket_seconds * bucket_seconds).label("bucket")
+
+    query = db.query(
+        bucket,
+        func.count(func.distinct(HashboardStatus.miner_id * 64 + HashboardStatus.chain)).label("boards"),
+        func.count().label("samples"),
+        func.avg(HashboardStatus.temp_chip).label("avg_temp_chip"),
+        func.max(HashboardStatus.temp_chip).label("max_temp_chip"),
+        func.avg(HashboardStatus.temp_board).label("avg_temp_board"),
+        func.avg(HashboardStatus.hashrate).label("avg_hashrate"),
+        func.min(HashboardStatus.chip_count).label("min_chip_count")
+    ).filter(HashboardStatus.timestamp >= since)
+
+    if model:
+        query = query.join(Miner, Miner.id == HashboardStatus.miner_id).filter(Miner.model == model)
+
+    rows = query.group_by(bucket).order_by(bucket).all()
+    return [{
+        "timestamp": datetime.utcfromtimestamp(int(row.bucket)),
+        "boards": row.boards,
+        "samples": row.samples,
+        "avg_temp_chip": row.avg_temp_chip,
+        "max_temp_chip": row.max_temp_chip,
+        "avg_temp_board": row.avg_temp_board,
+        "avg_hashrate": row.avg_hashrate,
+        "min_chip_count": row.min_chip_count
+    } for row in rows]
+
+def degraded_boards(db: Session, hours: int = 24, hashrate_drop: float = BOARD_HASHRATE_DROP,
+                    temp_limit: float = BOARD_TEMP_LIMIT, hw_error_delta: int = BOARD_HW_ERROR_DELTA,
+                    limit: int = 100) -> List[Dict]:
+    """查找退化的算力板
+
+    把时间窗口分成前后两半，按板比较：后半段平均算力比前半段下降超过 hashrate_drop、
+    芯片数减少、芯片温度达到 temp_limit 或硬件错误增量达到 hw_error_delta 之一即视为退化。
+    前半段有算力而后半段没有任何采样的板（整板掉线、不再上报）同样视为退化，missing 为 True。
+    硬件错误是累计计数，挖矿程序重启后会清零，增量按相邻采样的差值累加，差值为负时视为清零后重新计数。
+    """
+    now = datetime.utcnow()
+    since = now - timedelta(hours=hours)
+    middle = now - timedelta(hours=hours / 2)
+
+    previous_hw = func.lag(HashboardStatus.hw_errors).over(
+        partition_by=(HashboardStatus.miner_id, HashboardStatus.chain),
+        order_by=HashboardStatus.timestamp
+    )
+    samples = db.query(
+        HashboardStatus.miner_id,
+        HashboardStatus.chain,
+        HashboardStatus.timestamp,
+        HashboardStatus.hashrate,
+        HashboardStatus.chip_count,
+        HashboardStatus.temp_chip,
+        HashboardStatus.hw_errors,
+        previous_hw.label("previous_hw")
+    ).filter(HashboardStatus.timestamp >= since).subquery()
+
+    is_recent = samples.c.timestamp >= middle
+    recent_hashrate = func.avg(case((is_recent, samples.c.hashrate)))
+    earlier_hashrate = func.avg(case((~is_recent, samples.c.hashrate)))
+    recent_samples = func.count(case((is_recent, 1)))
+    # 后半段没有采样时按0个芯片计算
+    chip_loss = func.max(samples.c.chip_count) - func.coalesce(func.min(case((is_recent, samples.c.chip_count))), 0)
+    hw_step = samples.c.hw_errors - samples.c.previous_hw
+    hw_delta = func.coalesce(func.sum(case(
+        (samples.c.previous_hw.is_(None), 0),
+        (hw_step >= 0, hw_step),
+        else_=samples.c.hw_errors
+    )), 0)
+    max_temp = func.max(samples.c.temp_chip)
+    drop_ratio = 1 - recent_hashrate / func.nullif(earlier_hashrate, 0)
+
+    rows = db.query(
+        samples.c.miner_id,
+        samples.c.chain,
+        Miner.ip_address,
+        recent_hashrate.label("recent_hashrate"),
+        earlier_hashrate.label("earlier_hashrate"),
+        drop_ratio.label("drop_ratio"),
+        chip_loss.label("chip_loss"),
+        hw_delta.label("hw_error_delta"),
+        max_temp.label("max_temp_chip"),
+        (recent_samples == 0).label("missing")
+    ).join(
+        Miner, Miner.id == samples.c.miner_id
+    ).group_by(
+        samples.c.miner_id, samples.c.chain, Miner.ip_address
+    ).having(or_(
+        and_(earlier_hashrate > 0, recent_hashrate < earlier_hashrate * (1 - hashrate_drop)),
+        and_(earlier_hashrate > 0, recent_samples == 0),
+        chip_loss > 0,
+        max_temp >= temp_limit,
+        hw_delta >= hw_error_delta
+    )).order_by(
+        # 掉线的板按算力下降100%排序
+        func.coalesce(drop_ratio, case((recent_samples == 0, 1), else_=0)).desc(), hw_delta.desc()
+    ).limit(limit).all()
+
+    return [{
+        "miner_id": row.miner_id,
+        "ip_address": row.ip_address,
+        "chain": row.chain,
+        "recent_hashrate": row.recent_hashrate,
+        "earlier_hashrate": row.earlier_hashrate,
+        "drop_ratio": row.drop_ratio,
+        "chip_loss": row.chip_loss,
+        "hw_error_delta": row.hw_error_delta,
+        "max_temp_chip": row.max_temp_chip,
+        "missing": bool(row.missing)
+    } for row in rows]
+
+# 单块板历史返回的字段
+BOARD_HISTORY_FIELDS = ("timestamp", "temp_board", "temp_chip", "hashrate", "chip_count", "hw_errors")
+
+def board_history(db: Session, miner_id: int, hours: int = 24) -> Dict[int, Dict[str, list]]:
+    """单台矿机各算力板的历史，按链返回列格式 {chain: {字段: [值...]}}"""
+    since = datetime.utcnow() - timedelta(hours=hours)
+    rows = db.query(
+        HashboardStatus.chain,
+        *(getattr(HashboardStatus, name) for name in BOARD_HISTORY_FIELDS)
+    ).filter(
+        HashboardStatus.miner_id == miner_id,
+        HashboardStatus.timestamp >= since
+    ).order_by(HashboardStatus.chain, HashboardStatus.timestamp).all()
+
+    result: Dict[int, Dict[str, list]] = {}
+    for row in rows:
+        columns = result.get(row[0])
+        if columns is None:
+            columns = result[row[0]] = {name: [] for name in BOARD_HISTORY_FIELDS}
+        for i, name in enumerate(BOARD_HISTORY_FIELDS, start=1):
+            columns[name].append(row[i])
+    return result
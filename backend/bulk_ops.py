@@ -0,0 +1,326 @@
+"""
+批量操作服务 - 对选定矿机并发执行控制命令，记录任务进度和每台矿机的结果
+"""
+import asyncio
+import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from config import BULK_CONCURRENCY, BULK_RETRIES, BULK_RETRY_DELAY, BULK_PROGRESS_INTERVAL, DEBUG_MODE
+from database import SessionLocal, Miner, BulkJob, BulkJobResult
+from miner_api import MinerAPIClient, CONTROL_OK, CONTROL_REJECTED, CONTROL_UNSENT, CONTROL_UNCONFIRMED
+from miner_query import ip_prefix_filter
+from responses import dumps
+
+# 支持的操作 -> 必填参数
+OPERATIONS = {
+    "reboot": (),
+    "switch_pool": ("pool_id",),
+    "add_pool": ("url", "user"),
+    "set_frequency": ("frequency",),
+}
+
+# 必须为整数的参数
+INTEGER_PARAMS = ("pool_id", "frequency", "device")
+
+# 不能重复执行的操作：命令一旦发出就不再重试（否则矿机会被重复重启、矿池会被重复添加）
+NON_IDEMPOTENT_OPERATIONS = ("reboot", "add_pool")
+
+def result_status(operation: str, outcome: str) -> str:
+    """控制命令结果 -> 矿机执行结果
+
+    不能重试的操作（重启、添加矿池）已发出但未确认时记为 unconfirmed，按成功计数并单独标记便于核对；
+    可重复执行的操作已经重试过，仍未确认就是失败。
+    """
+    if outcome == CONTROL_OK:
+        return "succeeded"
+    if outcome == CONTROL_UNCONFIRMED and operation in NON_IDEMPOTENT_OPERATIONS:
+        return "unconfirmed"
+    return "failed"
+
+# 任务结束状态
+FINISHED_STATUSES = ("completed", "failed", "interrupted")
+
+# 正在执行的任务（保留引用，避免任务被垃圾回收）
+_running_jobs: Dict[int, asyncio.Task] = {}
+
+def validate_operation(operation: str, params: Dict):
+    """检查操作和参数"""
+    if operation not in OPERATIONS:
+        raise ValueError(f"不支持的操作: {operation}")
+    missing = [name for name in OPERATIONS[operation] if params.get(name) in (None, "")]
+    if missing:
+        raise ValueError(f"缺少参数: {', '.join(missing)}")
+    for name in INTEGER_PARAMS:
+        value = params.get(name)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not (
+            isinstance(value, int) or (isinstance(value, str) and value.strip().isdigit())
+        ):
+            raise ValueError(f"参数 {name} 必须是整数")
+
+def select_miners(db: Session, target: Dict) -> List[Miner]:
+    """按选择条件查询目标矿机
+
+    支持 miner_ids、ip_prefix、model、online，多个条件同时满足；
+    不带任何条件时必须显式指定 all=true，避免误操作全部矿机。
+    """
+    query = db.query(Miner)
+    has_condition = False
+    if target.get("miner_ids"):
+        query = query.filter(Miner.id.in_(target["miner_ids"]))
+        has_condition = True
+    if target.get("ip_prefix"):
+        query = query.filter(ip_prefix_filter(target["ip_prefix"]))
+        has_condition = True
+    if target.get("model"):
+        query = query.filter(Miner.model == target["model"])
+        has_condition = True
+    if target.get("online") is not None:
+        query = query.filter(Miner.is_online == bool(target["online"]))
+        has_condition = True
+    if not has_condition and not target.get("all"):
+        raise ValueError("请指定目标矿机（miner_ids、ip_prefix、model、online 或 all=true）")
+    return query.order_by(Miner.id).all()
+
+def create_job(db: Session, operation: str, params: Dict, target: Dict) -> BulkJob:
+    """创建批量任务及每台矿机的待执行记录"""
+    validate_operation(operation, params)
+    miners = select_miners(db, target)
+    if not miners:
+        raise ValueError("没有符合条件的矿机")
+
+    job = BulkJob(
+        operation=operation,
+        params=json.dumps(params),
+        target=json.dumps(target),
+        status="pending",
+        total=len(miners),
+        succeeded=0,
+        failed=0
+    )
+    db.add(job)
+    db.flush()
+    db.add_all([
+        BulkJobResult(job_id=job.id, miner_id=miner.id, ip_address=miner.ip_address, status="pending", attempts=0)
+        for miner in miners
+    ])
+    db.commit()
+    db.refresh(job)
+    return job
+
+async def _execute(client: MinerAPIClient, operation: str, params: Dict) -> Tuple[str, str]:
+    """对单台矿机执行一次命令，返回 (结果, 说明)，结果为 CONTROL_* 之一"""
+    if operation == "reboot":
+        return await client.restart()
+    if operation == "switch_pool":
+        return await client.switch_pool(int(params["pool_id"]))
+    if operation == "add_pool":
+        return await client.add_pool(params["url"], params["user"], params.get("password", "x"))
+    if operation == "set_frequency":
+        return await client.set_frequency(int(params["frequency"]), int(params.get("device", 0)))
+    raise ValueError(f"不支持的操作: {operation}")
+
+async def _run_on_miner(ip_address: str, operation: str, params: Dict,
+                        semaphore: asyncio.Semaphore) -> Tuple[str, str, int]:
+    """带重试地对单台矿机执行命令，返回 (结果, 说明, 尝试次数)
+
+    命令没有发出（连接失败）时总是可以重试；已经发出的命令只有可重复执行的操作才重试。
+    """
+    async with semaphore:
+        client = MinerAPIClient(ip_address)
+        delay = BULK_RETRY_DELAY
+        outcome, message = CONTROL_UNSENT, ""
+        for attempt in range(1, BULK_RETRIES + 2):
+            try:
+                outcome, message = await _execute(client, operation, params)
+            except Exception as e:
+                # 执行出错（如参数无法转换），按失败处理；不能重试的操作不会重复发送
+                outcome, message = CONTROL_REJECTED, str(e)
+            retryable = outcome == CONTROL_UNSENT or (
+                outcome != CONTROL_OK and operation not in NON_IDEMPOTENT_OPERATIONS
+            )
+            if not retryable or attempt > BULK_RETRIES:
+                return outcome, message, attempt
+            await asyncio.sleep(delay)
+            delay *= 2
+        return outcome, message, BULK_RETRIES + 1
+
+def _begin_job(job_id: int) -> Optional[Tuple[str, Dict, List[Tuple[int, str]]]]:
+    """把任务标记为执行中，返回 (操作, 参数, [(结果ID, IP)])；任务不存在或已开始时返回 None"""
+    db = SessionLocal()
+    try:
+        job = db.query(BulkJob).filter(BulkJob.id == job_id).first()
+        if not job or job.status != "pending":
+            return None
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        db.commit()
+        targets = db.query(BulkJobResult.id, BulkJobResult.ip_address).filter(
+            BulkJobResult.job_id == job_id,
+            BulkJobResult.status == "pending"
+        ).all()
+        return job.operation, json.loads(job.params or "{}"), [(row.id, row.ip_address) for row in targets]
+    finally:
+        db.close()
+
+def _save_results(job_id: int, items: List[Dict]):
+    """在一个事务中写入一批矿机执行结果并累加任务计数"""
+    db = SessionLocal()
+    try:
+        db.bulk_update_mappings(BulkJobResult, items)
+        failed = sum(1 for item in items if item["status"] == "failed")
+        db.query(BulkJob).filter(BulkJob.id == job_id).update({
+            BulkJob.succeeded: BulkJob.succeeded + (len(items) - failed),
+            BulkJob.failed: BulkJob.failed + failed
+        }, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def _finish_job(job_id: int, status: Optional[str] = None):
+    """结束任务；不指定状态时按失败数决定 completed/failed"""
+    db = SessionLocal()
+    try:
+        job = db.query(BulkJob).filter(BulkJob.id == job_id).first()
+        if job:
+            job.status = status or ("completed" if job.failed == 0 else "failed")
+            job.finished_at = datetime.utcnow()
+            db.commit()
+    finally:
+        db.close()
+
+async def run_job(job_id: int):
+    """执行批量任务
+
+    数据库操作都放到线程中执行，不阻塞事件循环（写入队列的线程也在写同一个数据库）；
+    各矿机的结果先在内存中收集，按 BULK_PROGRESS_INTERVAL 批量写入，写入失败时留到下一批重试。
+    """
+    try:
+        started = await asyncio.to_thread(_begin_job, job_id)
+        if started is None:
+            return
+        operation, params, targets = started
+        semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+        finished: List[Dict] = []
+        done = asyncio.Event()
+
+        async def worker(result_id: int, ip_address: str):
+            try:
+                outcome, message, attempts = await _run_on_miner(ip_address, operation, params, semaphore)
+            except Exception as e:
+                outcome, message, attempts = CONTROL_REJECTED, str(e), 0
+            finished.append({
+                "id": result_id,
+                "status": result_status(operation, outcome),
+                "message": message,
+                "attempts": attempts
+            })
+
+        async def flush_progress():
+            failures = 0
+            while True:
+                try:
+                    await asyncio.wait_for(done.wait(), timeout=BULK_PROGRESS_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                if finished:
+                    batch = finished[:]
+                    try:
+                        await asyncio.to_thread(_save_results, job_id, batch)
+                        del finished[:len(batch)]
+                        failures = 0
+                    except Exception as e:
+                        failures += 1
+                        if DEBUG_MODE:
+                            print(f"批量任务 {job_id} 保存进度失败: {e}")
+                        # 所有矿机都已执行完时不再无限重试
+                        if done.is_set() and failures > BULK_RETRIES:
+                            raise
+                        await asyncio.sleep(BULK_RETRY_DELAY)
+                        continue
+                if done.is_set() and not finished:
+                    return
+
+        flusher = asyncio.create_task(flush_progress())
+        await asyncio.gather(*(worker(result_id, ip) for result_id, ip in targets), return_exceptions=True)
+        done.set()
+        await flusher
+        await asyncio.to_thread(_finish_job, job_id)
+    except Exception as e:
+        if DEBUG_MODE:
+            print(f"批量任务 {job_id} 执行失败: {e}")
+        try:
+            await asyncio.to_thread(_finish_job, job_id, "failed")
+        except Exception:
+            pass
+    finally:
+        _running_jobs.pop(job_id, None)
+
+def start_job(job_id: int):
+    """在后台启动批量任务"""
+    _running_jobs[job_id] = asyncio.create_task(run_job(job_id))
+
+def recover_interrupted_jobs():
+    """服务重启后，将未完成的任务标记为中断"""
+    db = SessionLocal()
+    try:
+        db.query(BulkJob).filter(BulkJob.status.in_(("pending", "running"))).update(
+            {BulkJob.status: "interrupted", BulkJob.finished_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+def job_to_dict(job: BulkJob, results: Optional[List[BulkJobResult]] = None) -> Dict:
+    """任务转换为响应格式"""
+    data = {
+        "id": job.id,
+        "operation": job.operation,
+        "params": json.loads(job.params or "{}"),
+        "target": json.loads(job.target or "{}"),
+        "status": job.status,
+        "total": job.total,
+        "succeeded": job.succeeded,
+        "failed": job.failed,
+        "pending": job.total - job.succeeded - job.failed,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at
+    }
+    if results is not None:
+        data["results"] = [{
+            "miner_id": r.miner_id,
+            "ip_address": r.ip_address,
+            "status": r.status,
+            "attempts": r.attempts,
+            "message": r.message,
+            "updated_at": r.updated_at
+        } for r in results]
+    return data
+
+async def job_events(job_id: int, interval: float = 1.0) -> AsyncIterator[bytes]:
+    """以 Server-Sent Events 格式推送任务进度，任务结束后停止"""
+    last_payload = None
+    while True:
+        db = SessionLocal()
+        try:
+            job = db.query(BulkJob).filter(BulkJob.id == job_id).first()
+            if not job:
+                return
+            payload = dumps(job_to_dict(job))
+            finished = job.status in FINISHED_STATUSES
+        finally:
+            db.close()
+
+        if payload != last_payload:
+            last_payload = payload
+            yield b"data: " + payload + b"\n\n"
+        if finished:
+            return
+        await asyncio.sleep(interval)
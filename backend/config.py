@@ -12,6 +12,9 @@ IP_RANGES = [
     ("10.102.1.1", "10.102.1.65")
 ]
 
+# 拓扑配置文件（站点/机架/子网），存在时代替上面的 IP_RANGES，修改后自动重新加载
+TOPOLOGY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "topology.json")
+
 # 数据库配置
 DATABASE_URL = "sqlite:///./miners.db"
 
@@ -21,13 +24,58 @@ API_TIMEOUT = 3  # 减少超时时间，加快扫描速度
 # 日志配置
 DEBUG_MODE = False  # 设置为True可以看到详细的错误日志
 
+# 扫描并发数（拓扑配置中未指定时使用）
+DISCOVERY_CONCURRENCY = 100
+
 # 定时任务配置
 SCAN_INTERVAL = 300  # 扫描间隔（秒）- 增加到5分钟，避免频繁扫描
 STATUS_UPDATE_INTERVAL = 60  # 状态更新间隔（秒）- 增加到1分钟
 
+# 矿机列表分页配置
+MINER_PAGE_SIZE = 100  # 默认每页数量
+MINER_PAGE_SIZE_MAX = 1000  # 每页最大数量
+
+# 响应压缩配置
+COMPRESSION_MIN_SIZE = 500  # 小于此字节数的响应不压缩
+COMPRESSION_LEVEL = 5  # 压缩级别（gzip 1-9，brotli 0-11）
+
+# 批量操作配置
+BULK_CONCURRENCY = 50  # 同时操作的矿机数量
+BULK_RETRIES = 2  # 每台矿机失败后的重试次数
+BULK_RETRY_DELAY = 1.0  # 重试间隔（秒），每次重试翻倍
+BULK_PROGRESS_INTERVAL = 1.0  # 执行结果批量写入数据库的间隔（秒）
+
+# 写入缓冲配置
+INGEST_QUEUE_SIZE = 10000  # 队列容量（条），满时直接写入溢出文件
+INGEST_BATCH_SIZE = 500  # 每批写入的最大条数
+INGEST_FLUSH_INTERVAL = 1.0  # 凑批最长等待时间（秒）
+INGEST_RETRIES = 3  # 数据库锁冲突等错误的重试次数
+INGEST_RETRY_DELAY = 0.5  # 重试间隔（秒），每次重试翻倍
+INGEST_REPLAY_INTERVAL = 30  # 空闲时检查并回放溢出文件的间隔（秒）
+INGEST_SPILL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest_spill.jsonl")  # 溢出文件
+INGEST_DEAD_LETTER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest_dead_letter.jsonl")  # 无法写入的记录
+
+# 告警规则配置
+ALERT_TEMP_HIGH = 85.0  # 过温告警阈值（℃）
+ALERT_TEMP_CLEAR = 80.0  # 过温恢复阈值（℃），低于此值才关闭告警
+ALERT_FAN_MIN_RPM = 1000  # 风扇转速低于此值视为故障
+ALERT_HASHRATE_DROP_RATIO = 0.3  # 算力相对基线下降超过30%触发告警
+ALERT_HASHRATE_CLEAR_RATIO = 0.1  # 算力恢复到基线90%以上关闭告警
+ALERT_HASHRATE_EWMA_ALPHA = 0.1  # 算力基线指数平滑系数
+ALERT_OPEN_AFTER = 2  # 连续异常样本数达到后才打开告警
+ALERT_CLOSE_AFTER = 2  # 连续正常样本数达到后才关闭告警
+ALERT_FLAP_WINDOW = 10  # 抖动检测窗口（样本数）
+ALERT_FLAP_THRESHOLD = 4  # 窗口内在线状态切换次数达到此值视为抖动
+
+# 算力板退化检测配置
+BOARD_HASHRATE_DROP = 0.1  # 后半段平均算力比前半段下降超过10%
+BOARD_TEMP_LIMIT = 85.0  # 芯片温度达到此值（℃）
+BOARD_HW_ERROR_DELTA = 1000  # 窗口内硬件错误增量达到此值
+
 # 后端服务配置
 BACKEND_HOST = "0.0.0.0"
 BACKEND_PORT = 8000
+BACKEND_RELOAD = False  # 代码修改后自动重启，仅开发时设为True（生产环境开启会拖慢启动并额外占用进程）
 
 # CORS配置
 CORS_ORIGINS = [
@@ -1,8 +1,12 @@
 """
 数据库模型和连接
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, Boolean
+from sqlalchemy import (
+    create_engine, Column, Integer, SmallInteger, String, Float, DateTime, Text, Boolean, Index,
+    delete, func, insert, literal_column, select
+)
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 from config import DATABASE_URL
@@ -15,10 +19,10 @@ class Miner(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     ip_address = Column(String, unique=True, index=True, nullable=False)
-    model = Column(String)  # 矿机型号
+    model = Column(String, index=True)  # 矿机型号
     hostname = Column(String)  # 主机名
     mac_address = Column(String)  # MAC地址
-    is_online = Column(Boolean, default=False)  # 是否在线
+    is_online = Column(Boolean, default=False, index=True)  # 是否在线
     last_seen = Column(DateTime, default=datetime.utcnow)  # 最后在线时间
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -26,6 +30,10 @@ class Miner(Base):
 class MinerStatus(Base):
     """矿机状态表"""
     __tablename__ = "miner_status"
+    __table_args__ = (
+        # 按矿机查询历史/最新状态
+        Index("ix_miner_status_miner_id_timestamp", "miner_id", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     miner_id = Column(Integer, index=True)
@@ -63,6 +71,44 @@ class MinerStatus(Base):
     # 算力板信息（JSON格式存储）
     hashboard_info = Column(Text)  # 算力板详细信息
 
+class MinerLatest(Base):
+    """每台矿机的最新状态快照（由写入队列在写入状态时同步更新）
+
+    矿机列表按温度/算力过滤和排序时直接使用这张表的索引，不需要在 miner_status 中查找每台矿机的最新记录。
+    """
+    __tablename__ = "miner_latest"
+
+    miner_id = Column(Integer, primary_key=True)
+    status_id = Column(Integer)  # 最新一条 miner_status 记录的ID，未采集到状态时为空
+    timestamp = Column(DateTime)
+    temperature = Column(Float, index=True)  # 温度（temp_max，未采集时为芯片温度）
+    hashrate = Column(Float, index=True)  # 算力（hashrate，未采集时为5秒算力）
+
+# 列表排序使用的表达式索引（表达式须与 miner_query.SORT_FIELDS 保持一致，空值按 -1 排序）
+LATEST_TEMPERATURE_SORT = func.coalesce(MinerLatest.temperature, literal_column("-1.0"))
+LATEST_HASHRATE_SORT = func.coalesce(MinerLatest.hashrate, literal_column("-1.0"))
+Index("ix_miner_latest_temperature_sort", LATEST_TEMPERATURE_SORT, MinerLatest.miner_id)
+Index("ix_miner_latest_hashrate_sort", LATEST_HASHRATE_SORT, MinerLatest.miner_id)
+
+class HashboardStatus(Base):
+    """算力板（链）遥测表，每次采样每块板一行，便于在SQL中做全矿场趋势查询"""
+    __tablename__ = "hashboard_status"
+    __table_args__ = (
+        # 单块板的历史
+        Index("ix_hashboard_status_miner_chain_timestamp", "miner_id", "chain", "timestamp"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    miner_id = Column(Integer, nullable=False)
+    chain = Column(SmallInteger, nullable=False)  # 链序号（从0开始）
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    temp_board = Column(Float)  # 板温度（多个传感器取最大值）
+    temp_chip = Column(Float)  # 芯片温度（多个传感器取最大值）
+    hashrate = Column(Float)  # 算力（TH/s）
+    chip_count = Column(SmallInteger)  # 识别到的芯片数
+    hw_errors = Column(Integer)  # 累计硬件错误数
+    status = Column(String(16))  # 链状态
+
 class MinerLog(Base):
     """矿机日志表"""
     __tablename__ = "miner_logs"
@@ -74,13 +120,110 @@ class MinerLog(Base):
     message = Column(Text)
     source = Column(String)  # 日志来源
 
+class Alert(Base):
+    """告警事件表（每次故障对应一条记录，打开时写入，恢复时填写关闭时间）"""
+    __tablename__ = "alerts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    miner_id = Column(Integer, index=True)
+    rule = Column(String, index=True)  # 规则名称，如 over_temperature
+    severity = Column(String)  # WARNING, ERROR
+    message = Column(Text)
+    value = Column(Float)  # 触发时的观测值
+    opened_at = Column(DateTime, default=datetime.utcnow, index=True)
+    closed_at = Column(DateTime, index=True)  # 为空表示告警仍然有效
+
+class BulkJob(Base):
+    """批量操作任务表"""
+    __tablename__ = "bulk_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    operation = Column(String)  # reboot, switch_pool, add_pool, set_frequency
+    params = Column(Text)  # 操作参数（JSON格式）
+    target = Column(Text)  # 目标选择条件（JSON格式）
+    status = Column(String, index=True)  # pending, running, completed, failed, interrupted
+    total = Column(Integer, default=0)
+    succeeded = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class BulkJobResult(Base):
+    """批量操作中每台矿机的执行结果"""
+    __tablename__ = "bulk_job_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, index=True)
+    miner_id = Column(Integer, index=True)
+    ip_address = Column(String)
+    status = Column(String)  # pending, succeeded, unconfirmed（命令已发出但未确认）, failed
+    attempts = Column(Integer, default=0)
+    message = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 # 创建数据库引擎和会话
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 表结构版本，修改模型后递增，启动时只有版本落后才执行建表/建索引
+SCHEMA_VERSION = 3
+
 def init_db():
     """初始化数据库"""
     Base.metadata.create_all(bind=engine)
+    # create_all 不会给已存在的表补建索引，这里逐个补建
+    # （用 IF NOT EXISTS 而不是 checkfirst，反射检查识别不到表达式索引）
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+def get_schema_version() -> int:
+    """读取数据库中记录的表结构版本（SQLite user_version）"""
+    if engine.dialect.name != "sqlite":
+        return 0
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+
+def schema_is_current() -> bool:
+    """表结构是否为最新版本"""
+    return get_schema_version() >= SCHEMA_VERSION
+
+def rebuild_latest_snapshot():
+    """根据 miner_status 重建最新状态快照（升级到版本3时执行一次）"""
+    latest = select(
+        MinerStatus.miner_id,
+        func.max(MinerStatus.id).label("status_id")
+    ).group_by(MinerStatus.miner_id).subquery()
+    rows = select(
+        Miner.id,
+        MinerStatus.id,
+        MinerStatus.timestamp,
+        func.coalesce(MinerStatus.temp_max, MinerStatus.temp_chip),
+        func.coalesce(MinerStatus.hashrate, MinerStatus.hashrate_5s)
+    ).select_from(Miner).outerjoin(
+        latest, latest.c.miner_id == Miner.id
+    ).outerjoin(
+        MinerStatus, MinerStatus.id == latest.c.status_id
+    )
+    with engine.begin() as conn:
+        conn.execute(delete(MinerLatest))
+        conn.execute(insert(MinerLatest).from_select(
+            ["miner_id", "status_id", "timestamp", "temperature", "hashrate"], rows
+        ))
+
+def migrate():
+    """迁移：表结构版本落后时建表、补建索引并记录版本"""
+    version = get_schema_version()
+    if version >= SCHEMA_VERSION:
+        return
+    init_db()
+    if version < 3:
+        rebuild_latest_snapshot()
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
 def get_db():
     """获取数据库会话"""
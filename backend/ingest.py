@@ -0,0 +1,391 @@
+"""
+写入缓冲 - 有界队列 + 独立写入任务，数据库繁忙或不可用时写入本地溢出文件并在之后回放
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from config import (
+    INGEST_QUEUE_SIZE, INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL, INGEST_RETRIES,
+    INGEST_RETRY_DELAY, INGEST_REPLAY_INTERVAL, INGEST_SPILL_FILE, INGEST_DEAD_LETTER_FILE, DEBUG_MODE
+)
+from database import SessionLocal, Miner, MinerStatus, MinerLatest, HashboardStatus, MinerLog, Alert
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+def save_alert_events(db: Session, miner_id: int, ip_address: str, events: List[Dict]):
+    """保存告警事件：打开时新增告警记录，关闭时填写关闭时间，并各写一条日志"""
+    for event in events:
+        timestamp = _parse_time(event["timestamp"])
+        if event["type"] == "open":
+            db.add(Alert(
+                miner_id=miner_id,
+                rule=event["rule"],
+                severity=event["severity"],
+                message=event["message"],
+                value=event["value"],
+                opened_at=timestamp
+            ))
+            db.add(MinerLog(
+                miner_id=miner_id,
+                timestamp=timestamp,
+                log_level=event["severity"],
+                message=f"告警触发 [{event['rule']}] {ip_address}: {event['message']}",
+                source="alert"
+            ))
+        else:
+            db.query(Alert).filter(
+                Alert.miner_id == miner_id,
+                Alert.rule == event["rule"],
+                Alert.closed_at == None
+            ).update({Alert.closed_at: timestamp}, synchronize_session=False)
+            db.add(MinerLog(
+                miner_id=miner_id,
+                timestamp=timestamp,
+                log_level="INFO",
+                message=f"告警恢复 [{event['rule']}] {ip_address}: {event['message']}",
+                source="alert"
+            ))
+
+def make_record(miner_id: int, ip_address: str, timestamp: datetime, miner: Dict,
+                status: Optional[Dict] = None, alerts: Optional[List[Dict]] = None,
+                boards: Optional[List[Dict]] = None) -> Dict:
+    """构造一条采样记录（只包含JSON原生类型，可以直接写入溢出文件）
+
+    - miner: 需要更新的矿机字段（is_online、last_seen、model、hostname）
+    - status: MinerStatus 的列值，离线时为 None
+    - alerts: 告警引擎产生的事件
+    - boards: 每块算力板的遥测数据（HashboardStatus 的列值）
+    """
+    def encode(data: Dict) -> Dict:
+        return {k: v.isoformat() if isinstance(v, datetime) else v for k, v in data.items()}
+
+    return {
+        "miner_id": miner_id,
+        "ip_address": ip_address,
+        "timestamp": timestamp.isoformat(),
+        "miner": encode(miner),
+        "status": encode(status) if status else None,
+        "alerts": [encode(event) for event in alerts or []],
+        "boards": boards or []
+    }
+
+def _coalesce(data: Dict, *keys):
+    for key in keys:
+        if data.get(key) is not None:
+            return data[key]
+    return None
+
+def write_records(db: Session, records: List[Dict]):
+    """在一个事务中写入一批记录（不提交），同时更新最新状态快照"""
+    statuses = []
+    boards = []
+    # 每台矿机在本批中的最新快照；离线样本不改变状态指针，只保证快照行存在
+    snapshots: Dict[int, Dict] = {}
+    for record in records:
+        updates = dict(record["miner"])
+        if "last_seen" in updates:
+            updates["last_seen"] = _parse_time(updates["last_seen"])
+        if updates:
+            db.query(Miner).filter(Miner.id == record["miner_id"]).update(updates, synchronize_session=False)
+        snapshots.setdefault(record["miner_id"], {"miner_id": record["miner_id"]})
+        if record["status"]:
+            status = record["status"]
+            statuses.append(dict(
+                status,
+                miner_id=record["miner_id"],
+                timestamp=_parse_time(record["timestamp"])
+            ))
+            snapshots[record["miner_id"]] = {
+                "miner_id": record["miner_id"],
+                "status_index": len(statuses) - 1,
+                "timestamp": statuses[-1]["timestamp"],
+                "temperature": _coalesce(status, "temp_max", "temp_chip"),
+                "hashrate": _coalesce(status, "hashrate", "hashrate_5s")
+            }
+        if record.get("boards"):
+            timestamp = _parse_time(record["timestamp"])
+            boards.extend(
+                dict(board, miner_id=record["miner_id"], timestamp=timestamp)
+                for board in record["boards"]
+            )
+        if record["alerts"]:
+            save_alert_events(db, record["miner_id"], record["ip_address"], record["alerts"])
+    status_ids = []
+    if statuses:
+        status_ids = db.scalars(
+            insert(MinerStatus).returning(MinerStatus.id, sort_by_parameter_order=True), statuses
+        ).all()
+    if boards:
+        db.bulk_insert_mappings(HashboardStatus, boards)
+
+    for snapshot in snapshots.values():
+        if "status_index" in snapshot:
+            snapshot["status_id"] = status_ids[snapshot.pop("status_index")]
+    existing = set(db.scalars(
+        select(MinerLatest.miner_id).where(MinerLatest.miner_id.in_(list(snapshots)))
+    ))
+    new_rows = [snapshot for miner_id, snapshot in snapshots.items() if miner_id not in existing]
+    changed_rows = [
+        snapshot for miner_id, snapshot in snapshots.items()
+        if miner_id in existing and "status_id" in snapshot
+    ]
+    if new_rows:
+        db.bulk_insert_mappings(MinerLatest, new_rows)
+    if changed_rows:
+        db.bulk_update_mappings(MinerLatest, changed_rows)
+
+class IngestQueue:
+    """采样写入队列
+
+    轮询任务只负责 submit，写入任务按批提交；遇到“database is locked”等错误时退避重试，
+    仍然失败则追加到溢出文件，数据库恢复后按顺序回放，保证采样不丢失。
+    """
+
+    def __init__(self, maxsize: int = INGEST_QUEUE_SIZE, batch_size: int = INGEST_BATCH_SIZE,
+                 flush_interval: float = INGEST_FLUSH_INTERVAL, spill_path: str = INGEST_SPILL_FILE,
+                 dead_letter_path: str = INGEST_DEAD_LETTER_FILE):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.replay_path = spill_path + ".replay"
+        self.dead_letter_path = dead_letter_path
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._spill_lock = threading.Lock()
+        self.metrics = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "retries": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "dropped": 0,
+            "dead_letter": 0,
+            "overflow": 0,
+            "last_batch_size": 0,
+            "last_write_ms": None,
+            "last_error": None,
+        }
+
+    def start(self):
+        """启动写入任务（需在事件循环中调用）"""
+        if self._task is None:
+            self.queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止写入任务，写完队列中剩余的记录"""
+        if self._task is None:
+            return
+        await self.queue.put(None)
+        await self._task
+        self._task = None
+
+    def submit(self, record: Dict):
+        """提交一条记录；队列已满时直接写入溢出文件（背压计入 overflow）"""
+        if self.queue is None:
+            # 写入任务未启动（如脚本中直接调用），同步写入
+            self._write_or_spill([record])
+            return
+        try:
+            self.queue.put_nowait(record)
+            self.metrics["enqueued"] += 1
+        except asyncio.QueueFull:
+            self.metrics["overflow"] += 1
+            self._spill([record])
+
+    def get_metrics(self) -> Dict:
+        """获取队列指标"""
+        return dict(
+            self.metrics,
+            queue_size=self.queue.qsize() if self.queue else 0,
+            queue_max=self.maxsize,
+            spill_pending=self._has_spill()
+        )
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                first = await asyncio.wait_for(self.queue.get(), timeout=INGEST_REPLAY_INTERVAL)
+            except asyncio.TimeoutError:
+                # 空闲时尝试回放溢出文件
+                if self._has_spill():
+                    await asyncio.to_thread(self._replay)
+                continue
+
+            stopping = first is None
+            batch = [] if stopping else [first]
+            deadline = loop.time() + self.flush_interval
+            while not stopping and len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    stopping = True
+                else:
+                    batch.append(record)
+
+            if stopping:
+                while not self.queue.empty():
+                    record = self.queue.get_nowait()
+                    if record is not None:
+                        batch.append(record)
+            if batch:
+                await asyncio.to_thread(self._write_or_spill, batch)
+            if stopping:
+                return
+
+    def _write_or_spill(self, records: List[Dict]):
+        """写入一批记录；有未回放的溢出数据时先回放，保证写入顺序"""
+        if self._has_spill() and not self._replay():
+            self._spill(records)
+            return
+        handled, _ = self._write_batch(records)
+        if handled < len(records):
+            self._spill(records[handled:])
+
+    def _write_batch(self, records: List[Dict]) -> Tuple[int, int]:
+        """按顺序写入数据库，返回 (已处理条数, 已写入条数)
+
+        已处理包括写入成功和写入死信文件的记录；数据库不可用时 records[已处理条数:] 没有写入，
+        由调用方按原顺序保存（溢出文件或回放文件开头）。
+        整批写入遇到数据本身的错误时改为逐条写入，只把有问题的记录写入死信文件，
+        同批其他记录（包括其中的告警事件）照常写入。
+        """
+        result, error = self._commit(records)
+        if result == "ok":
+            return len(records), len(records)
+        if result == "busy":
+            return 0, 0
+
+        written = 0
+        for index, record in enumerate(records):
+            result, error = self._commit([record])
+            if result == "ok":
+                written += 1
+            elif result == "invalid":
+                self._dead_letter(record, error)
+            else:
+                # 逐条写入过程中数据库变得不可用，剩余记录交还调用方
+                return index, written
+        return len(records), written
+
+    def _commit(self, records: List[Dict]) -> Tuple[str, Optional[Exception]]:
+        """在一个事务中写入，锁冲突等操作错误时退避重试
+
+        返回 ("ok" | "busy" | "invalid", 错误)：busy 为重试后数据库仍不可用，invalid 为数据本身有问题。
+        """
+        delay = INGEST_RETRY_DELAY
+        error: Optional[Exception] = None
+        for attempt in range(INGEST_RETRIES + 1):
+            db = SessionLocal()
+            start = time.perf_counter()
+            try:
+                write_records(db, records)
+                db.commit()
+                self.metrics["written"] += len(records)
+                self.metrics["batches"] += 1
+                self.metrics["last_batch_size"] = len(records)
+                self.metrics["last_write_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                return "ok", None
+            except OperationalError as e:
+                db.rollback()
+                error = e
+                self.metrics["last_error"] = str(e.orig) if e.orig else str(e)
+                if attempt < INGEST_RETRIES:
+                    self.metrics["retries"] += 1
+                    time.sleep(delay)
+                    delay *= 2
+            except Exception as e:
+                db.rollback()
+                self.metrics["last_error"] = str(e)
+                return "invalid", e
+            finally:
+                db.close()
+        return "busy", error
+
+    def _dead_letter(self, record: Dict, error: Optional[Exception]):
+        """把无法写入的记录追加到死信文件，便于排查后手动处理"""
+        with self._spill_lock:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "error": str(error),
+                    "failed_at": datetime.utcnow().isoformat(),
+                    "record": record
+                }, ensure_ascii=False) + "\n")
+        self.metrics["dead_letter"] += 1
+        if DEBUG_MODE:
+            print(f"采样记录无法写入，已写入死信文件 (矿机 {record.get('miner_id')}): {error}")
+
+    def _has_spill(self) -> bool:
+        return os.path.exists(self.replay_path) or (
+            os.path.exists(self.spill_path) and os.path.getsize(self.spill_path) > 0
+        )
+
+    def _spill(self, records: List[Dict]):
+        """追加到溢出文件（每行一条JSON）"""
+        with self._spill_lock:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.metrics["spilled"] += len(records)
+
+    def _replay(self) -> bool:
+        """按顺序回放溢出文件，全部写入成功返回 True
+
+        回放前把溢出文件改名为 .replay，之后新的溢出数据写入新文件，不会与回放冲突；
+        中途失败时把未写入的部分写回 .replay，下次从断点继续。
+        """
+        if not os.path.exists(self.replay_path):
+            with self._spill_lock:
+                if not os.path.exists(self.spill_path):
+                    return True
+                os.replace(self.spill_path, self.replay_path)
+
+        with open(self.replay_path, "r", encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+
+        offset = 0
+        while offset < len(lines):
+            chunk = lines[offset:offset + self.batch_size]
+            parsed = []
+            for line in chunk:
+                try:
+                    parsed.append((line, json.loads(line)))
+                except ValueError:
+                    # 进程异常退出时最后一行可能不完整
+                    self.metrics["dropped"] += 1
+            handled, written = self._write_batch([record for _, record in parsed])
+            self.metrics["replayed"] += written
+            if handled < len(parsed):
+                # 未写入的记录按原顺序放回 .replay 开头，下次从这里继续，不写入溢出文件以免顺序错乱
+                remaining = self.replay_path + ".tmp"
+                with open(remaining, "w", encoding="utf-8") as f:
+                    f.writelines(line for line, _ in parsed[handled:])
+                    f.writelines(lines[offset + len(chunk):])
+                os.replace(remaining, self.replay_path)
+                return False
+            offset += len(chunk)
+
+        os.remove(self.replay_path)
+        # 回放期间可能又产生了新的溢出数据
+        if os.path.exists(self.spill_path):
+            return self._replay()
+        return True
+
+# 全局写入队列
+ingest_queue = IngestQueue()
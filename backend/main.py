@@ -1,22 +1,42 @@
 """
 主应用入口
 """
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Optional
 from datetime import datetime, timedelta
 import asyncio
+import time
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
-from config import CORS_ORIGINS, STATUS_UPDATE_INTERVAL, SCAN_INTERVAL, DEBUG_MODE
-from database import init_db, get_db, Miner, MinerStatus, MinerLog
+from config import (
+    CORS_ORIGINS, SCAN_INTERVAL, DEBUG_MODE, MINER_PAGE_SIZE, MINER_PAGE_SIZE_MAX,
+    BOARD_HASHRATE_DROP, BOARD_TEMP_LIMIT, BOARD_HW_ERROR_DELTA
+)
+from database import migrate, schema_is_current, get_db, Miner, MinerStatus, MinerLatest, MinerLog, Alert, BulkJob, BulkJobResult
 from miner_api import MinerAPIClient
 from miner_discovery import MinerDiscovery
+from topology import topology_manager, Topology, Subnet
+from alert_engine import AlertEngine
+from ingest import ingest_queue, make_record
+from state_cache import latest_state
+from miner_query import query_miners
+from responses import FastJSONResponse, CompressionMiddleware, RawJSON
+import bulk_ops
+import board_telemetry
 import json
 
-app = FastAPI(title="矿机管理系统API")
+app = FastAPI(title="矿机管理系统API", default_response_class=FastJSONResponse)
+
+# 历史曲线返回的字段
+HISTORY_FIELDS = ("timestamp", "temp_chip", "temp_pcb", "hashrate", "power_consumption")
+
+# 响应压缩（按 Accept-Encoding 协商 br/gzip）
+app.add_middleware(CompressionMiddleware)
 
 # CORS配置
 app.add_middleware(
@@ -27,26 +47,69 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 初始化数据库
-init_db()
+# 定时任务调度器（启动时创建）
+scheduler: Optional[AsyncIOScheduler] = None
+
+# 启动状态（用于健康检查）
+app_state = {
+    "started_at": datetime.utcnow(),
+    "schema_ready": False,
+    "cache_warmed": False,
+    "first_poll_at": None
+}
+
+# 告警引擎（保存每台矿机的增量状态）
+alert_engine = AlertEngine()
+
+def restore_open_alerts():
+    """从数据库恢复未关闭的告警到告警引擎"""
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        for alert in db.query(Alert).filter(Alert.closed_at == None).all():
+            alert_engine.restore(alert.miner_id, alert.rule)
+    finally:
+        db.close()
 
-# 定时任务调度器
-scheduler = AsyncIOScheduler()
+def prepare_database():
+    """启动准备：表结构落后时执行迁移，然后从最新状态快照预热缓存并恢复告警/任务状态"""
+    from database import SessionLocal
+    if not schema_is_current():
+        migrate()
+    app_state["schema_ready"] = True
+    
+    db = SessionLocal()
+    try:
+        latest_state.warm(db)
+    finally:
+        db.close()
+    app_state["cache_warmed"] = True
+    
+    restore_open_alerts()
+    bulk_ops.recover_interrupted_jobs()
 
 @app.on_event("startup")
 async def startup_event():
     """启动时初始化"""
+    global scheduler
+    await asyncio.to_thread(prepare_database)
+    ingest_queue.start()
+    
+    scheduler = AsyncIOScheduler()
     scheduler.start()
     # 启动定时任务
     # max_instances=1: 同一时间只允许一个实例运行
     # coalesce=True: 如果任务被跳过，合并执行
+    # next_run_time=now: 启动后立即在后台执行第一次轮询和扫描，不必等待一个完整周期
+    now = datetime.now()
     scheduler.add_job(
         update_all_miners_status,
-        IntervalTrigger(seconds=STATUS_UPDATE_INTERVAL),
+        IntervalTrigger(seconds=topology_manager.get().min_poll_interval),
         id="update_status",
         max_instances=1,
         coalesce=True,
-        misfire_grace_time=60  # 允许60秒的延迟
+        misfire_grace_time=60,  # 允许60秒的延迟
+        next_run_time=now
     )
     scheduler.add_job(
         discover_new_miners,
@@ -54,13 +117,25 @@ async def startup_event():
         id="discover_miners",
         max_instances=1,
         coalesce=True,
-        misfire_grace_time=300  # 允许5分钟的延迟
+        misfire_grace_time=300,  # 允许5分钟的延迟
+        next_run_time=now
     )
 
+def reschedule_status_update(topology: Topology):
+    """拓扑变化后按最小子网轮询间隔调整状态更新周期"""
+    job = scheduler.get_job("update_status") if scheduler else None
+    if job and job.trigger.interval.total_seconds() != topology.min_poll_interval:
+        scheduler.reschedule_job("update_status", trigger=IntervalTrigger(seconds=topology.min_poll_interval))
+
+topology_manager.on_reload(reschedule_status_update)
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """关闭时清理"""
-    scheduler.shutdown()
+    if scheduler:
+        scheduler.shutdown()
+    # 写完缓冲队列中剩余的采样
+    await ingest_queue.stop()
 
 # ============ API路由 ============
 
@@ -69,58 +144,69 @@ async def root():
     """根路径"""
     return {"message": "矿机管理系统API", "version": "1.0.0"}
 
-@app.get("/api/miners", response_model=List[dict])
-async def get_miners(db: Session = Depends(get_db)):
-    """获取所有矿机列表"""
-    miners = db.query(Miner).all()
-    result = []
-    for miner in miners:
-        # 获取最新状态
-        latest_status = db.query(MinerStatus).filter(
-            MinerStatus.miner_id == miner.id
-        ).order_by(MinerStatus.timestamp.desc()).first()
-        
-        miner_dict = {
-            "id": miner.id,
-            "ip_address": miner.ip_address,
-            "model": miner.model,
-            "hostname": miner.hostname,
-            "mac_address": miner.mac_address,
-            "is_online": miner.is_online,
-            "last_seen": miner.last_seen.isoformat() if miner.last_seen else None,
-            "latest_status": None
-        }
-        
-        if latest_status:
-            miner_dict["latest_status"] = {
-                "timestamp": latest_status.timestamp.isoformat(),
-                "temp_chip": latest_status.temp_chip,
-                "temp_pcb": latest_status.temp_pcb,
-                "temp_max": latest_status.temp_max,
-                "power_consumption": latest_status.power_consumption,
-                "humidity": latest_status.humidity,
-                "hashrate": latest_status.hashrate,
-                "hashrate_5s": latest_status.hashrate_5s,
-                "hashrate_avg": latest_status.hashrate_avg,
-                "fan_speed_1": latest_status.fan_speed_1,
-                "fan_speed_2": latest_status.fan_speed_2,
-                "fan_speed_3": latest_status.fan_speed_3,
-                "fan_speed_4": latest_status.fan_speed_4,
-                "pool_url": latest_status.pool_url,
-                "pool_user": latest_status.pool_user,
-                "pool_status": latest_status.pool_status,
-                "uptime": latest_status.uptime,
-                "network_status": latest_status.network_status,
-                "hashboard_info": json.loads(latest_status.hashboard_info) if latest_status.hashboard_info else []
-            }
-        
-        result.append(miner_dict)
+@app.get("/api/health")
+async def health():
+    """健康检查：表结构就绪、缓存已预热且完成第一次轮询后返回 ready"""
+    ready = app_state["schema_ready"] and app_state["cache_warmed"] and app_state["first_poll_at"] is not None
+    content = {
+        "status": "ready" if ready else "starting",
+        "schema_ready": app_state["schema_ready"],
+        "cache_warmed": app_state["cache_warmed"],
+        "first_poll_at": app_state["first_poll_at"],
+        "uptime": (datetime.utcnow() - app_state["started_at"]).total_seconds(),
+        "ingest_queue_size": ingest_queue.get_metrics()["queue_size"]
+    }
+    return FastJSONResponse(content, status_code=200 if ready else 503)
+
+@app.get("/api/miners")
+async def get_miners(
+    fields: Optional[str] = None,
+    online: Optional[bool] = None,
+    model: Optional[str] = None,
+    ip_prefix: Optional[str] = None,
+    min_temp: Optional[float] = None,
+    max_temp: Optional[float] = None,
+    min_hashrate: Optional[float] = None,
+    max_hashrate: Optional[float] = None,
+    sort: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(MINER_PAGE_SIZE, ge=1, le=MINER_PAGE_SIZE_MAX),
+    db: Session = Depends(get_db)
+):
+    """获取矿机列表（键集分页）
     
-    return result
+    - fields: 逗号分隔的字段列表，状态字段放在 latest_status 中；latest_status 表示全部状态字段
+    - sort: 排序字段（id, ip_address, hostname, model, temperature, hashrate），前缀 - 表示降序
+    - cursor: 上一页返回的 next_cursor
+    """
+    try:
+        return FastJSONResponse(query_miners(
+            db,
+            fields=fields,
+            online=online,
+            model=model,
+            ip_prefix=ip_prefix,
+            min_temp=min_temp,
+            max_temp=max_temp,
+            min_hashrate=min_hashrate,
+            max_hashrate=max_hashrate,
+            sort=sort,
+            cursor=cursor,
+            limit=limit
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/miners/{miner_id}")
-async def get_miner_detail(miner_id: int, db: Session = Depends(get_db)):
-    """获取矿机详细信息"""
+async def get_miner_detail(
+    miner_id: int,
+    history_format: str = Query("rows", pattern="^(rows|columnar)$"),
+    db: Session = Depends(get_db)
+):
+    """获取矿机详细信息
+    
+    - history_format: rows 返回对象数组；columnar 返回按列组织的数组（时间戳数组 + 各指标数组）
+    """
     miner = db.query(Miner).filter(Miner.id == miner_id).first()
     if not miner:
         raise HTTPException(status_code=404, detail="矿机不存在")
@@ -130,9 +216,9 @@ async def get_miner_detail(miner_id: int, db: Session = Depends(get_db)):
         MinerStatus.miner_id == miner_id
     ).order_by(MinerStatus.timestamp.desc()).first()
     
-    # 获取历史状态（最近24小时）
+    # 获取历史状态（最近24小时），只查询需要的列
     yesterday = datetime.utcnow() - timedelta(days=1)
-    history = db.query(MinerStatus).filter(
+    history = db.query(*(getattr(MinerStatus, name) for name in HISTORY_FIELDS)).filter(
         MinerStatus.miner_id == miner_id,
         MinerStatus.timestamp >= yesterday
     ).order_by(MinerStatus.timestamp.asc()).all()
@@ -149,7 +235,7 @@ async def get_miner_detail(miner_id: int, db: Session = Depends(get_db)):
         "hostname": miner.hostname,
         "mac_address": miner.mac_address,
         "is_online": miner.is_online,
-        "last_seen": miner.last_seen.isoformat() if miner.last_seen else None,
+        "last_seen": miner.last_seen,
         "latest_status": None,
         "history": [],
         "logs": []
@@ -157,7 +243,7 @@ async def get_miner_detail(miner_id: int, db: Session = Depends(get_db)):
     
     if latest_status:
         result["latest_status"] = {
-            "timestamp": latest_status.timestamp.isoformat(),
+            "timestamp": latest_status.timestamp,
             "temp_chip": latest_status.temp_chip,
             "temp_pcb": latest_status.temp_pcb,
             "temp_max": latest_status.temp_max,
@@ -175,26 +261,25 @@ async def get_miner_detail(miner_id: int, db: Session = Depends(get_db)):
             "pool_status": latest_status.pool_status,
             "uptime": latest_status.uptime,
             "network_status": latest_status.network_status,
-            "hashboard_info": json.loads(latest_status.hashboard_info) if latest_status.hashboard_info else []
+            "hashboard_info": RawJSON(latest_status.hashboard_info)
         }
     
-    result["history"] = [{
-        "timestamp": s.timestamp.isoformat(),
-        "temp_chip": s.temp_chip,
-        "temp_pcb": s.temp_pcb,
-        "hashrate": s.hashrate,
-        "power_consumption": s.power_consumption
-    } for s in history]
+    if history_format == "columnar":
+        result["history"] = {
+            name: [row[i] for row in history] for i, name in enumerate(HISTORY_FIELDS)
+        }
+    else:
+        result["history"] = [dict(zip(HISTORY_FIELDS, row)) for row in history]
     
     result["logs"] = [{
         "id": log.id,
-        "timestamp": log.timestamp.isoformat(),
+        "timestamp": log.timestamp,
         "log_level": log.log_level,
         "message": log.message,
         "source": log.source
     } for log in logs]
     
-    return result
+    return FastJSONResponse(result)
 
 @app.get("/api/miners/{miner_id}/status")
 async def get_miner_status(miner_id: int, db: Session = Depends(get_db)):
@@ -235,104 +320,254 @@ async def discover_miners_endpoint(db: Session = Depends(get_db)):
                     last_seen=datetime.utcnow()
                 )
                 db.add(miner)
+                db.flush()
+                db.add(MinerLatest(miner_id=miner.id))
                 db.commit()
                 db.refresh(miner)
+                latest_state.update(miner.id, miner.last_seen, True)
                 discovered_count += 1
     
     return {"message": f"发现 {discovered_count} 台新矿机", "total": len(miner_ips)}
 
 @app.get("/api/stats")
-async def get_stats(db: Session = Depends(get_db)):
-    """获取统计信息"""
-    total_miners = db.query(Miner).count()
-    online_miners = db.query(Miner).filter(Miner.is_online == True).count()
-    
-    # 总算力
-    latest_statuses = db.query(MinerStatus).join(Miner).filter(
-        Miner.is_online == True
-    ).distinct(MinerStatus.miner_id).all()
-    
-    total_hashrate = sum(s.hashrate or 0 for s in latest_statuses)
-    total_power = sum(s.power_consumption or 0 for s in latest_statuses)
+async def get_stats():
+    """获取统计信息（来自最新状态缓存）"""
+    return latest_state.stats()
+
+@app.get("/api/alerts")
+async def get_alerts(
+    active_only: bool = False,
+    miner_id: Optional[int] = None,
+    limit: int = 200,
+    db: Session = Depends(get_db)
+):
+    """获取告警列表"""
+    query = db.query(Alert)
+    if active_only:
+        query = query.filter(Alert.closed_at == None)
+    if miner_id is not None:
+        query = query.filter(Alert.miner_id == miner_id)
+    alerts = query.order_by(Alert.opened_at.desc()).limit(limit).all()
     
-    return {
-        "total_miners": total_miners,
-        "online_miners": online_miners,
-        "offline_miners": total_miners - online_miners,
-        "total_hashrate": total_hashrate,
-        "total_power": total_power
-    }
+    return [{
+        "id": alert.id,
+        "miner_id": alert.miner_id,
+        "rule": alert.rule,
+        "severity": alert.severity,
+        "message": alert.message,
+        "value": alert.value,
+        "opened_at": alert.opened_at.isoformat() if alert.opened_at else None,
+        "closed_at": alert.closed_at.isoformat() if alert.closed_at else None
+    } for alert in alerts]
+
+@app.get("/api/miners/{miner_id}/boards")
+async def get_miner_boards(miner_id: int, hours: int = Query(24, ge=1, le=720), db: Session = Depends(get_db)):
+    """获取矿机各算力板的历史（按链返回列格式）"""
+    if not db.query(Miner.id).filter(Miner.id == miner_id).first():
+        raise HTTPException(status_code=404, detail="矿机不存在")
+    return FastJSONResponse(board_telemetry.board_history(db, miner_id, hours))
+
+@app.get("/api/boards/trend")
+async def get_board_trend(
+    hours: int = Query(24, ge=1, le=720),
+    bucket: int = Query(3600, ge=60),
+    model: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """全矿场算力板健康趋势（按时间桶聚合）"""
+    return FastJSONResponse(board_telemetry.board_trend(db, hours, bucket, model))
+
+@app.get("/api/boards/degraded")
+async def get_degraded_boards(
+    hours: int = Query(24, ge=1, le=720),
+    hashrate_drop: float = Query(BOARD_HASHRATE_DROP, ge=0, le=1),
+    temp_limit: float = BOARD_TEMP_LIMIT,
+    hw_error_delta: int = Query(BOARD_HW_ERROR_DELTA, ge=1),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """查找退化的算力板（算力下降、芯片丢失、过温或硬件错误增长）"""
+    return FastJSONResponse(board_telemetry.degraded_boards(
+        db, hours, hashrate_drop, temp_limit, hw_error_delta, limit
+    ))
+
+@app.get("/api/ingest")
+async def get_ingest_metrics():
+    """获取写入队列指标（队列长度、批次、重试、溢出和回放计数）"""
+    return FastJSONResponse(ingest_queue.get_metrics())
+
+@app.get("/api/topology")
+async def get_topology():
+    """获取当前拓扑配置（last_error 为最近一次加载失败的原因）"""
+    data = topology_manager.get().to_dict()
+    data["last_error"] = topology_manager.last_error
+    data["last_error_at"] = topology_manager.last_error_at
+    return FastJSONResponse(data)
+
+@app.post("/api/topology/reload")
+async def reload_topology():
+    """重新加载拓扑配置文件（配置无效时返回400，继续使用旧配置）"""
+    try:
+        topology = topology_manager.reload(strict=True)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"拓扑配置无效: {e}")
+    return FastJSONResponse(topology.to_dict())
+
+class BulkJobRequest(BaseModel):
+    """批量操作请求"""
+    operation: str  # reboot, switch_pool, add_pool, set_frequency
+    params: dict = {}
+    target: dict = {}  # miner_ids, ip_prefix, model, online, all
+
+@app.post("/api/jobs")
+async def create_bulk_job(request: BulkJobRequest, db: Session = Depends(get_db)):
+    """创建批量操作任务并在后台执行"""
+    try:
+        job = bulk_ops.create_job(db, request.operation, request.params, request.target)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    bulk_ops.start_job(job.id)
+    return FastJSONResponse(bulk_ops.job_to_dict(job))
+
+@app.get("/api/jobs")
+async def get_bulk_jobs(limit: int = 50, db: Session = Depends(get_db)):
+    """获取最近的批量任务"""
+    jobs = db.query(BulkJob).order_by(BulkJob.id.desc()).limit(limit).all()
+    return FastJSONResponse([bulk_ops.job_to_dict(job) for job in jobs])
+
+@app.get("/api/jobs/{job_id}")
+async def get_bulk_job(job_id: int, db: Session = Depends(get_db)):
+    """获取批量任务详情及每台矿机的结果"""
+    job = db.query(BulkJob).filter(BulkJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    results = db.query(BulkJobResult).filter(
+        BulkJobResult.job_id == job_id
+    ).order_by(BulkJobResult.miner_id).all()
+    return FastJSONResponse(bulk_ops.job_to_dict(job, results))
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_bulk_job(job_id: int, db: Session = Depends(get_db)):
+    """以事件流推送任务进度（text/event-stream）"""
+    if not db.query(BulkJob.id).filter(BulkJob.id == job_id).first():
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return StreamingResponse(bulk_ops.job_events(job_id), media_type="text/event-stream")
 
 # ============ 定时任务 ============
 
+# 每台矿机上次轮询的时间（time.monotonic），用于按子网轮询间隔跳过未到期的矿机
+last_polled = {}
+
+async def fetch_miner_data(miner_ip: str, subnet: Subnet, semaphore: asyncio.Semaphore) -> Optional[dict]:
+    """按子网的超时和并发限制获取并解析矿机数据"""
+    async with semaphore:
+        client = MinerAPIClient(miner_ip, timeout=subnet.timeout)
+        data = await client.get_all_info()
+        if not data:
+            return None
+        parsed = client.parse_miner_data(data)
+        parsed["boards"] = client.parse_board_telemetry(data)
+        return parsed
+
 async def update_all_miners_status():
     """更新所有矿机状态"""
     from database import SessionLocal
     db = SessionLocal()
     try:
-        miners = db.query(Miner).all()
-        for miner in miners:
+        topology = topology_manager.get()
+        now = time.monotonic()
+        # 调度周期的一半作为容差，避免因调度抖动错过一个周期
+        slack = topology.min_poll_interval / 2
+        
+        miners = []
+        subnets = []
+        for miner in db.query(Miner).all():
+            subnet = topology.subnet_for(miner.ip_address)
+            if now - last_polled.get(miner.id, float("-inf")) + slack >= subnet.poll_interval:
+                miners.append(miner)
+                subnets.append(subnet)
+        # 读取完成后立即释放数据库连接，网络请求期间不占用数据库，写入交给写入队列
+        db.close()
+        
+        # 并发获取数据（每个子网使用各自的并发上限）
+        semaphores = {}
+        for subnet in subnets:
+            if id(subnet) not in semaphores:
+                semaphores[id(subnet)] = asyncio.Semaphore(subnet.concurrency)
+        results = await asyncio.gather(
+            *(fetch_miner_data(miner.ip_address, subnet, semaphores[id(subnet)]) for miner, subnet in zip(miners, subnets)),
+            return_exceptions=True
+        )
+        
+        for miner, parsed in zip(miners, results):
+            last_polled[miner.id] = now
+            timestamp = datetime.utcnow()
+            miner_updates = {"is_online": False}
+            status = None
+            boards = None
             try:
-                client = MinerAPIClient(miner.ip_address)
-                data = await client.get_all_info()
+                if isinstance(parsed, Exception):
+                    raise parsed
                 
-                if data:
-                    parsed = client.parse_miner_data(data)
-                    
+                if parsed:
                     # 更新矿机基本信息
-                    miner.is_online = parsed.get("is_online", False)
-                    miner.last_seen = datetime.utcnow()
+                    miner_updates = {
+                        "is_online": parsed.get("is_online", False),
+                        "last_seen": timestamp
+                    }
                     if parsed.get("model"):
-                        miner.model = parsed.get("model")
+                        miner_updates["model"] = parsed.get("model")
                     if parsed.get("hostname"):
-                        miner.hostname = parsed.get("hostname")
+                        miner_updates["hostname"] = parsed.get("hostname")
                     
                     # 保存状态
-                    status = MinerStatus(
-                        miner_id=miner.id,
-                        temp_chip=parsed.get("temp_chip"),
-                        temp_pcb=parsed.get("temp_pcb"),
-                        temp_max=parsed.get("temp_max"),
-                        power_consumption=parsed.get("power_consumption"),
-                        humidity=parsed.get("humidity"),
-                        hashrate=parsed.get("hashrate"),
-                        hashrate_5s=parsed.get("hashrate_5s"),
-                        hashrate_avg=parsed.get("hashrate_avg"),
-                        fan_speed_1=parsed.get("fan_speeds", [None])[0] if len(parsed.get("fan_speeds", [])) > 0 else None,
-                        fan_speed_2=parsed.get("fan_speeds", [None])[1] if len(parsed.get("fan_speeds", [])) > 1 else None,
-                        fan_speed_3=parsed.get("fan_speeds", [None])[2] if len(parsed.get("fan_speeds", [])) > 2 else None,
-                        fan_speed_4=parsed.get("fan_speeds", [None])[3] if len(parsed.get("fan_speeds", [])) > 3 else None,
-                        pool_url=parsed.get("pool_info", [{}])[0].get("url") if parsed.get("pool_info") else None,
-                        pool_user=parsed.get("pool_info", [{}])[0].get("user") if parsed.get("pool_info") else None,
-                        pool_status=parsed.get("pool_info", [{}])[0].get("status") if parsed.get("pool_info") else None,
-                        uptime=parsed.get("uptime"),
-                        network_status=parsed.get("network_status"),
-                        hasboard_info=json.dumps(parsed.get("hashboard_info", []))
-                    )
-                    db.add(status)
-                    
-                    # 记录日志
-                    if not parsed.get("is_online"):
-                        log = MinerLog(
-                            miner_id=miner.id,
-                            log_level="WARNING",
-                            message=f"矿机离线: {miner.ip_address}",
-                            source="system"
-                        )
-                        db.add(log)
+                    fan_speeds = parsed.get("fan_speeds") or []
+                    pool = parsed.get("pool_info")[0] if parsed.get("pool_info") else {}
+                    status = {
+                        "temp_chip": parsed.get("temp_chip"),
+                        "temp_pcb": parsed.get("temp_pcb"),
+                        "temp_max": parsed.get("temp_max"),
+                        "power_consumption": parsed.get("power_consumption"),
+                        "humidity": parsed.get("humidity"),
+                        "hashrate": parsed.get("hashrate"),
+                        "hashrate_5s": parsed.get("hashrate_5s"),
+                        "hashrate_avg": parsed.get("hashrate_avg"),
+                        "fan_speed_1": fan_speeds[0] if len(fan_speeds) > 0 else None,
+                        "fan_speed_2": fan_speeds[1] if len(fan_speeds) > 1 else None,
+                        "fan_speed_3": fan_speeds[2] if len(fan_speeds) > 2 else None,
+                        "fan_speed_4": fan_speeds[3] if len(fan_speeds) > 3 else None,
+                        "pool_url": pool.get("url"),
+                        "pool_user": pool.get("user"),
+                        "pool_status": pool.get("status"),
+                        "uptime": parsed.get("uptime"),
+                        "network_status": parsed.get("network_status"),
+                        "hashboard_info": json.dumps(parsed.get("hashboard_info", []))
+                    }
+                    boards = parsed.get("boards")
                 else:
-                    miner.is_online = False
+                    parsed = {"is_online": False}
                     
             except Exception as e:
                 if DEBUG_MODE:
                     print(f"更新矿机 {miner.ip_address} 状态失败: {e}")
-                miner.is_online = False
-        
-        db.commit()
+                parsed = {"is_online": False}
+                miner_updates = {"is_online": False}
+                status = None
+                boards = None
+            
+            # 评估告警规则（只在告警打开/关闭时写入记录）
+            events = alert_engine.evaluate(miner.id, parsed, timestamp)
+            
+            latest_state.update(miner.id, timestamp, miner_updates["is_online"], status)
+            
+            # 提交到写入队列，数据库繁忙时不会阻塞轮询，也不会丢失
+            ingest_queue.submit(make_record(
+                miner.id, miner.ip_address, timestamp, miner_updates, status, events, boards
+            ))
+        app_state["first_poll_at"] = datetime.utcnow()
     except Exception as e:
         if DEBUG_MODE:
             print(f"更新矿机状态失败: {e}")
-        db.rollback()
     finally:
         db.close()
 
@@ -342,6 +577,7 @@ async def discover_new_miners():
     db = SessionLocal()
     try:
         miner_ips = await MinerDiscovery.discover_miners_batch()
+        new_miners = []
         
         for ip in miner_ips:
             existing = db.query(Miner).filter(Miner.ip_address == ip).first()
@@ -359,8 +595,14 @@ async def discover_new_miners():
                         last_seen=datetime.utcnow()
                     )
                     db.add(miner)
+                    db.flush()
+                    # 每台矿机在最新状态快照中都有一行，列表按温度/算力排序时不会遗漏
+                    db.add(MinerLatest(miner_id=miner.id))
+                    new_miners.append(miner)
         
         db.commit()
+        for miner in new_miners:
+            latest_state.update(miner.id, miner.last_seen, True)
         if DEBUG_MODE and miner_ips:
             print(f"发现 {len(miner_ips)} 个在线矿机")
     except Exception as e:
@@ -3,16 +3,48 @@
 """
 import httpx
 import json
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from config import MINER_API_PORT, API_TIMEOUT, DEBUG_MODE
 
+def _unwrap(response) -> Dict:
+    """命令响应可能是字典、单元素列表或None（请求失败），统一为字典"""
+    if isinstance(response, list):
+        response = response[0] if response else {}
+    return response if isinstance(response, dict) else {}
+
+def _to_float(value) -> Optional[float]:
+    """转换数值，兼容 "123.4"、"3250W" 等字符串"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        try:
+            return float(str(value).rstrip("WwGgTtMmHhSs/ "))
+        except ValueError:
+            return None
+
+def _max_number(value) -> Optional[float]:
+    """取多传感器温度字符串（如 "39-41-55-56"）中的最大值"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    numbers = [_to_float(part) for part in str(value or "").split("-")]
+    numbers = [n for n in numbers if n is not None]
+    return max(numbers) if numbers else None
+
+# 控制命令的执行结果
+CONTROL_OK = "ok"  # 矿机确认执行
+CONTROL_REJECTED = "rejected"  # 矿机返回错误
+CONTROL_UNSENT = "unsent"  # 连接失败，命令没有发出，可以安全重试
+CONTROL_UNCONFIRMED = "unconfirmed"  # 命令已发出但没有收到确认（如重启时连接被断开）
+
 class MinerAPIClient:
     """Antminer API客户端"""
     
-    def __init__(self, ip_address: str):
+    def __init__(self, ip_address: str, timeout: Optional[float] = None):
         self.ip_address = ip_address
         self.base_url = f"http://{ip_address}:{MINER_API_PORT}"
-        self.timeout = API_TIMEOUT
+        self.timeout = timeout or API_TIMEOUT
     
     async def _request(self, command: Dict) -> Optional[Dict]:
         """发送API请求"""
@@ -63,6 +95,71 @@ class MinerAPIClient:
         command = {"command": "network"}
         return await self._request(command)
     
+    async def _send(self, command: Dict) -> Tuple[Optional[Dict], bool]:
+        """发送控制命令，返回 (响应, 是否已发出)
+
+        只有建立连接失败时才能确定命令没有发出；读取超时、连接被断开等情况下矿机可能已经执行了命令。
+        """
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.post(
+                    self.base_url,
+                    json=command,
+                    headers={"Content-Type": "application/json"}
+                )
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            return None, False
+        except Exception:
+            return None, True
+        if response.status_code != 200:
+            return None, True
+        try:
+            return response.json(), True
+        except ValueError:
+            return None, True
+    
+    async def _control(self, command: str, parameter: Optional[str] = None) -> Tuple[str, str]:
+        """发送控制命令，返回 (结果, 说明)，结果为 CONTROL_* 之一"""
+        payload = {"command": command}
+        if parameter is not None:
+            payload["parameter"] = parameter
+        response, sent = await self._send(payload)
+        if not sent:
+            return CONTROL_UNSENT, "无法连接到矿机"
+        if response is None:
+            return CONTROL_UNCONFIRMED, "命令已发出，但没有收到矿机的确认"
+        status = response.get("STATUS")
+        if isinstance(status, list) and status:
+            status = status[0]
+        if isinstance(status, dict):
+            ok, message = status.get("STATUS") in ("S", "I"), status.get("Msg", "")
+        else:
+            # 部分固件直接返回 {"STATUS": "S"}
+            ok, message = status in ("S", "I"), str(response.get("Msg", ""))
+        return (CONTROL_OK if ok else CONTROL_REJECTED), message
+    
+    async def restart(self) -> Tuple[str, str]:
+        """重启挖矿程序
+        
+        重启时挖矿程序通常来不及正常回复，只要命令已经送达（包括返回非成功状态）就视为未确认而不是失败。
+        """
+        result, message = await self._control("restart")
+        if result == CONTROL_REJECTED:
+            return CONTROL_UNCONFIRMED, message or "命令已发出，矿机未返回成功状态"
+        return result, message
+    
+    async def switch_pool(self, pool_id: int) -> Tuple[str, str]:
+        """切换到指定矿池（矿池序号）"""
+        return await self._control("switchpool", str(pool_id))
+    
+    async def add_pool(self, url: str, user: str, password: str = "x") -> Tuple[str, str]:
+        """添加矿池"""
+        return await self._control("addpool", f"{url},{user},{password}")
+    
+    async def set_frequency(self, frequency: int, device: int = 0) -> Tuple[str, str]:
+        """设置频率（ascset freq，需固件支持）"""
+        return await self._control("ascset", f"{device},freq,{frequency}")
+    
     async def get_all_info(self) -> Optional[Dict]:
         """获取所有信息"""
         try:
@@ -105,6 +202,7 @@ class MinerAPIClient:
             "hashrate_5s": None,
             "hashrate_avg": None,
             "fan_speeds": [],
+            "fan_count": None,
             "pool_info": [],
             "uptime": None,
             "network_status": "unknown",
@@ -112,12 +210,12 @@ class MinerAPIClient:
         }
         
         try:
-            summary = data.get("summary", {})
-            stats = data.get("stats", [{}])[0] if data.get("stats") else {}
-            pools = data.get("pools", {}).get("POOLS", [])
-            devs = data.get("devs", {}).get("DEVS", [])
-            version = data.get("version", [{}])[0] if data.get("version") else {}
-            network = data.get("network", [{}])[0] if data.get("network") else {}
+            summary = _unwrap(data.get("summary"))
+            stats = _unwrap(data.get("stats"))
+            pools = _unwrap(data.get("pools")).get("POOLS", [])
+            devs = _unwrap(data.get("devs")).get("DEVS", [])
+            version = _unwrap(data.get("version"))
+            network = _unwrap(data.get("network"))
             
             # 基本信息
             if summary.get("STATUS") == "S":
@@ -154,6 +252,13 @@ class MinerAPIClient:
                             fan_speeds.append(summary_data[0][fan_key])
                     result["fan_speeds"] = fan_speeds
             
+            # 已安装的风扇数（stats 中的 fan_num），用于区分未安装风扇的槽位
+            for entry in stats.get("STATS") or []:
+                fan_count = _to_float(entry.get("fan_num", entry.get("Fan Num")))
+                if fan_count is not None:
+                    result["fan_count"] = int(fan_count)
+                    break
+            
             # 功耗
             if stats.get("STATS"):
                 stats_data = stats["STATS"]
@@ -187,9 +292,9 @@ class MinerAPIClient:
             result["pool_info"] = pool_list
             
             # 算力板信息
-            hasboard_list = []
+            hashboard_list = []
             for dev in devs:
-                hasboard_info = {
+                hashboard_info = {
                     "id": dev.get("ID", 0),
                     "status": dev.get("Status", ""),
                     "temperature": dev.get("Temperature", 0),
@@ -199,8 +304,8 @@ class MinerAPIClient:
                     "fan_speed": dev.get("Fan Speed", 0),
                     "chain": dev.get("Chain", "")
                 }
-                hasboard_list.append(hashboard_info)
-            result["hashboard_info"] = hasboard_list
+                hashboard_list.append(hashboard_info)
+            result["hashboard_info"] = hashboard_list
             
             # 网络状态
             if network.get("STATUS"):
@@ -213,3 +318,70 @@ class MinerAPIClient:
                 print(f"解析 {self.ip_address} 数据失败: {e}")
         
         return result
+    
+    def parse_board_telemetry(self, data: Dict) -> List[Dict]:
+        """解析每块算力板（链）的遥测数据
+        
+        devs 命令提供每条链的状态和温度，stats 命令提供 chain_acn（芯片数）、chain_hw（硬件错误）、
+        chain_rate（算力，GH/s）等字段（序号从1开始，对应 devs 中从0开始的 ASC）。
+        返回 [{"chain", "temp_board", "temp_chip", "hashrate"(TH/s), "chip_count", "hw_errors", "status"}]
+        """
+        boards: Dict[int, Dict] = {}
+        if not data:
+            return []
+        
+        def board(chain: int) -> Dict:
+            return boards.setdefault(chain, {
+                "chain": chain,
+                "temp_board": None,
+                "temp_chip": None,
+                "hashrate": None,
+                "chip_count": None,
+                "hw_errors": None,
+                "status": None
+            })
+        
+        try:
+            for index, dev in enumerate(_unwrap(data.get("devs")).get("DEVS", [])):
+                chain = dev.get("ASC", dev.get("ID", index))
+                try:
+                    chain = int(chain)
+                except (TypeError, ValueError):
+                    chain = index
+                item = board(chain)
+                item["status"] = dev.get("Status")
+                item["temp_board"] = _max_number(dev.get("PCB Temp", dev.get("Temperature")))
+                item["temp_chip"] = _max_number(dev.get("Chip Temp"))
+                mhs = _to_float(dev.get("MHS 5s"))
+                if mhs is not None:
+                    item["hashrate"] = mhs / 1000000
+                hw_errors = _to_float(dev.get("Hardware Errors"))
+                if hw_errors is not None:
+                    item["hw_errors"] = int(hw_errors)
+            
+            for entry in _unwrap(data.get("stats")).get("STATS", []):
+                for i in range(1, 17):
+                    chip_count = _to_float(entry.get(f"chain_acn{i}"))
+                    rate = _to_float(entry.get(f"chain_rate{i}"))
+                    # 固件会把不存在的链报告为0；devs 中出现过的链即使芯片数和算力都为0（整板故障）也要记录
+                    if not chip_count and not rate and (i - 1) not in boards:
+                        continue
+                    item = board(i - 1)
+                    if chip_count is not None:
+                        item["chip_count"] = int(chip_count)
+                    if rate is not None:
+                        item["hashrate"] = rate / 1000
+                    hw_errors = _to_float(entry.get(f"chain_hw{i}"))
+                    if hw_errors is not None:
+                        item["hw_errors"] = int(hw_errors)
+                    temp_board = _max_number(entry.get(f"temp_pcb{i}", entry.get(f"temp{i}")))
+                    if temp_board is not None:
+                        item["temp_board"] = temp_board
+                    temp_chip = _max_number(entry.get(f"temp_chip{i}", entry.get(f"temp2_{i}")))
+                    if temp_chip is not None:
+                        item["temp_chip"] = temp_chip
+        except Exception as e:
+            if DEBUG_MODE:
+                print(f"解析 {self.ip_address} 算力板数据失败: {e}")
+        
+        return [boards[chain] for chain in sorted(boards)]
@@ -1,32 +1,25 @@
 """
-矿机发现服务 - 扫描IP范围发现矿机
+矿机发现服务 - 按拓扑配置扫描子网发现矿机
 """
 import asyncio
 import ipaddress
-from typing import List, Set
+from typing import List, Optional, Iterator, Tuple
 from miner_api import MinerAPIClient
-from config import IP_RANGES
+from topology import topology_manager, iter_ip_range, scan_ranges, Subnet
 
 class MinerDiscovery:
     """矿机发现服务"""
     
     @staticmethod
     def ip_range_to_list(start_ip: str, end_ip: str) -> List[str]:
-        """将IP范围转换为IP列表"""
-        start = ipaddress.IPv4Address(start_ip)
-        end = ipaddress.IPv4Address(end_ip)
-        ip_list = []
-        current = start
-        while current <= end:
-            ip_list.append(str(current))
-            current += 1
-        return ip_list
+        """将IP范围转换为IP列表（大范围请使用 iter_ip_range 惰性遍历）"""
+        return list(iter_ip_range(start_ip, end_ip))
     
     @staticmethod
-    async def check_miner(ip: str) -> bool:
+    async def check_miner(ip: str, timeout: Optional[float] = None) -> bool:
         """检查IP是否为矿机"""
         try:
-            client = MinerAPIClient(ip)
+            client = MinerAPIClient(ip, timeout=timeout)
             summary = await client.get_summary()
             if summary and summary.get("STATUS") == "S":
                 return True
@@ -36,66 +29,69 @@ class MinerDiscovery:
         return False
     
     @staticmethod
-    async def discover_miners() -> List[str]:
-        """发现所有矿机IP地址"""
-        all_ips: Set[str] = set()
-        
-        # 收集所有IP地址
-        for start_ip, end_ip in IP_RANGES:
-            ip_list = MinerDiscovery.ip_range_to_list(start_ip, end_ip)
-            all_ips.update(ip_list)
-        
-        # 并发检查所有IP
-        tasks = [MinerDiscovery.check_miner(ip) for ip in all_ips]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+    async def scan_subnet(subnet: Subnet, ranges: Optional[List[Tuple[int, int]]] = None,
+                          timeout_per_ip: Optional[float] = None) -> List[str]:
+        """扫描单个子网，按子网的并发数和超时设置，地址惰性生成
         
-        # 找出在线的矿机
+        ranges 为需要扫描的整数地址段（默认整个子网），用于跳过与其他子网重叠的部分。
+        """
+        timeout = timeout_per_ip or subnet.timeout
+        ranges = ranges or [(subnet.start, subnet.end)]
+        size = sum(end - start + 1 for start, end in ranges)
+        hosts: Iterator[str] = (
+            str(ipaddress.IPv4Address(value))
+            for start, end in ranges
+            for value in range(start, end + 1)
+        )
         miner_ips = []
-        for ip, is_miner in zip(all_ips, results):
-            if isinstance(is_miner, bool) and is_miner:
-                miner_ips.append(ip)
         
+        async def worker():
+            # 所有worker共享同一个迭代器，内存占用与子网大小无关
+            for ip in hosts:
+                try:
+                    is_miner = await asyncio.wait_for(
+                        MinerDiscovery.check_miner(ip, timeout=timeout),
+                        timeout=timeout + 1
+                    )
+                except asyncio.TimeoutError:
+                    is_miner = False
+                if is_miner:
+                    miner_ips.append(ip)
+        
+        await asyncio.gather(*(worker() for _ in range(min(subnet.concurrency, size))))
         return miner_ips
     
     @staticmethod
-    async def discover_miners_batch(batch_size: int = 100, timeout_per_ip: float = 2.0) -> List[str]:
-        """批量发现矿机（避免过多并发）"""
-        all_ips: Set[str] = set()
+    async def discover_miners() -> List[str]:
+        """发现所有矿机IP地址"""
+        return await MinerDiscovery.discover_miners_batch()
+    
+    @staticmethod
+    async def discover_miners_batch(batch_size: Optional[int] = None, timeout_per_ip: Optional[float] = None) -> List[str]:
+        """按拓扑扫描所有子网（各子网并行，子网内按各自的并发数限制）
         
-        # 收集所有IP地址
-        for start_ip, end_ip in IP_RANGES:
-            ip_list = MinerDiscovery.ip_range_to_list(start_ip, end_ip)
-            all_ips.update(ip_list)
+        batch_size、timeout_per_ip 不为空时覆盖拓扑中的并发数和超时。
+        """
+        topology = topology_manager.get()
         
-        miner_ips = []
-        ip_list = list(all_ips)
+        subnets = topology.subnets
+        if batch_size:
+            subnets = [
+                Subnet(s.start, s.end, site=s.site, rack=s.rack, timeout=s.timeout,
+                       concurrency=batch_size, poll_interval=s.poll_interval, name=s.name)
+                for s in subnets
+            ]
         
-        # 分批处理，使用更大的批次和超时控制
-        for i in range(0, len(ip_list), batch_size):
-            batch = ip_list[i:i + batch_size]
-            tasks = []
-            for ip in batch:
-                # 为每个任务添加超时包装
-                async def check_with_timeout(ip_addr: str):
-                    try:
-                        return await asyncio.wait_for(
-                            MinerDiscovery.check_miner(ip_addr),
-                            timeout=timeout_per_ip
-                        )
-                    except asyncio.TimeoutError:
-                        return False
-                
-                tasks.append(check_with_timeout(ip))
-            
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for ip, result in zip(batch, results):
-                if isinstance(result, bool) and result:
-                    miner_ips.append(ip)
-                # 其他情况（异常、False等）都忽略
-            
-            # 批次之间稍微延迟，避免过载
-            if i + batch_size < len(ip_list):
-                await asyncio.sleep(0.05)
+        results = await asyncio.gather(
+            # 重叠的子网按整数区间预先裁剪，不需要记录扫描过的每个地址
+            *(MinerDiscovery.scan_subnet(subnet, ranges, timeout_per_ip) for subnet, ranges in scan_ranges(subnets)),
+            return_exceptions=True
+        )
+        
+        miner_ips = []
+        for result in results:
+            if isinstance(result, list):
+                miner_ips.extend(result)
+            # 单个子网扫描异常时忽略，不影响其他子网
         
         return miner_ips
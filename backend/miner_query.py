@@ -0,0 +1,188 @@
+"""
+矿机列表查询 - 分页、过滤、排序和字段投影（全部下推到SQL执行）
+"""
+import base64
+import json
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import Session
+from database import Miner, MinerStatus, MinerLatest, LATEST_TEMPERATURE_SORT, LATEST_HASHRATE_SORT
+from config import MINER_PAGE_SIZE
+from responses import RawJSON
+
+# 矿机基本字段
+MINER_FIELDS = ("id", "ip_address", "model", "hostname", "mac_address", "is_online", "last_seen")
+
+# 最新状态字段（返回在 latest_status 中）
+STATUS_FIELDS = (
+    "timestamp", "temp_chip", "temp_pcb", "temp_max", "power_consumption", "humidity",
+    "hashrate", "hashrate_5s", "hashrate_avg",
+    "fan_speed_1", "fan_speed_2", "fan_speed_3", "fan_speed_4",
+    "pool_url", "pool_user", "pool_status", "uptime", "network_status", "hashboard_info"
+)
+
+# 可排序字段 -> 排序表达式（空值替换为固定值，保证游标比较稳定）
+SORT_FIELDS = {
+    "id": Miner.id,
+    "ip_address": Miner.ip_address,
+    "hostname": func.coalesce(Miner.hostname, ""),
+    "model": func.coalesce(Miner.model, ""),
+    # 温度和算力来自最新状态快照，走 miner_latest 上的表达式索引
+    "temperature": LATEST_TEMPERATURE_SORT,
+    "hashrate": LATEST_HASHRATE_SORT,
+}
+
+# 按最新状态排序的字段
+LATEST_SORT_FIELDS = ("temperature", "hashrate")
+
+def parse_fields(fields: Optional[str]) -> Tuple[List[str], List[str]]:
+    """解析 fields 参数，返回 (矿机字段, 状态字段)；未指定时返回全部字段"""
+    if not fields:
+        return list(MINER_FIELDS), list(STATUS_FIELDS)
+
+    miner_fields = ["id"]
+    status_fields = []
+    for name in (f.strip() for f in fields.split(",")):
+        if not name:
+            continue
+        if name == "latest_status":
+            status_fields.extend(f for f in STATUS_FIELDS if f not in status_fields)
+        elif name in MINER_FIELDS:
+            if name not in miner_fields:
+                miner_fields.append(name)
+        elif name in STATUS_FIELDS:
+            if name not in status_fields:
+                status_fields.append(name)
+        else:
+            raise ValueError(f"未知字段: {name}")
+    return miner_fields, status_fields
+
+def parse_sort(sort: Optional[str]) -> Tuple[str, bool]:
+    """解析 sort 参数，前缀 - 表示降序，返回 (字段, 是否降序)"""
+    sort = sort or "id"
+    descending = sort.startswith("-")
+    key = sort.lstrip("-")
+    if key not in SORT_FIELDS:
+        raise ValueError(f"不支持的排序字段: {key}")
+    return key, descending
+
+def encode_cursor(value, miner_id: int) -> str:
+    """编码游标（排序值 + 矿机ID）"""
+    raw = json.dumps([value, miner_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[object, int]:
+    """解码游标"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, miner_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return value, int(miner_id)
+    except Exception:
+        raise ValueError("无效的游标")
+
+def ip_prefix_filter(prefix: str):
+    """IP前缀过滤，用范围比较代替 LIKE 以便使用 ip_address 索引"""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(Miner.ip_address >= prefix, Miner.ip_address < upper)
+
+def _serialize_value(name: str, value):
+    """转换为响应层可直接序列化的值（datetime 由序列化器处理，JSON文本原样嵌入）"""
+    if name == "hashboard_info":
+        return RawJSON(value)
+    return value
+
+def query_miners(
+    db: Session,
+    fields: Optional[str] = None,
+    online: Optional[bool] = None,
+    model: Optional[str] = None,
+    ip_prefix: Optional[str] = None,
+    min_temp: Optional[float] = None,
+    max_temp: Optional[float] = None,
+    min_hashrate: Optional[float] = None,
+    max_hashrate: Optional[float] = None,
+    sort: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = MINER_PAGE_SIZE,
+) -> Dict:
+    """查询矿机列表，返回 {"items": [...], "next_cursor": ...}"""
+    miner_fields, status_fields = parse_fields(fields)
+    sort_key, descending = parse_sort(sort)
+    sort_expr = SORT_FIELDS[sort_key]
+
+    # 按温度/算力过滤或排序时从快照表出发，使用其索引（快照表中每台矿机都有一行）；
+    # 其余情况从矿机表出发，需要状态字段时按主键关联快照和状态记录
+    use_latest = sort_key in LATEST_SORT_FIELDS or any(
+        value is not None for value in (min_temp, max_temp, min_hashrate, max_hashrate)
+    )
+    id_column = MinerLatest.miner_id if use_latest else Miner.id
+
+    columns = [getattr(Miner, name).label(name) for name in miner_fields]
+    columns += [getattr(MinerStatus, name).label(f"status_{name}") for name in status_fields]
+    columns += [sort_expr.label("sort_value")]
+
+    if use_latest:
+        query = db.query(*columns).select_from(MinerLatest).join(Miner, Miner.id == MinerLatest.miner_id)
+    else:
+        query = db.query(*columns).select_from(Miner)
+        if status_fields:
+            query = query.outerjoin(MinerLatest, MinerLatest.miner_id == Miner.id)
+    if status_fields:
+        query = query.add_columns(MinerStatus.id.label("status_id")).outerjoin(
+            MinerStatus, MinerStatus.id == MinerLatest.status_id
+        )
+
+    # 过滤条件
+    if online is not None:
+        query = query.filter(Miner.is_online == online)
+    if model:
+        query = query.filter(Miner.model == model)
+    if ip_prefix:
+        query = query.filter(ip_prefix_filter(ip_prefix))
+    if min_temp is not None:
+        query = query.filter(MinerLatest.temperature >= min_temp)
+    if max_temp is not None:
+        query = query.filter(MinerLatest.temperature <= max_temp)
+    if min_hashrate is not None:
+        query = query.filter(MinerLatest.hashrate >= min_hashrate)
+    if max_hashrate is not None:
+        query = query.filter(MinerLatest.hashrate <= max_hashrate)
+
+    # 键集分页：(排序值, id) 严格大于/小于上一页最后一行
+    if cursor:
+        last_value, last_id = decode_cursor(cursor)
+        if sort_key == "id":
+            query = query.filter(Miner.id < last_id if descending else Miner.id > last_id)
+        elif descending:
+            query = query.filter(or_(sort_expr < last_value, and_(sort_expr == last_value, id_column < last_id)))
+        else:
+            query = query.filter(or_(sort_expr > last_value, and_(sort_expr == last_value, id_column > last_id)))
+
+    if sort_key == "id":
+        order_by = [Miner.id.desc() if descending else Miner.id.asc()]
+    elif descending:
+        order_by = [sort_expr.desc(), id_column.desc()]
+    else:
+        order_by = [sort_expr.asc(), id_column.asc()]
+
+    rows = query.order_by(*order_by).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for row in rows:
+        item = {name: _serialize_value(name, getattr(row, name)) for name in miner_fields}
+        if status_fields:
+            item["latest_status"] = None
+            if row.status_id is not None:
+                item["latest_status"] = {
+                    name: _serialize_value(name, getattr(row, f"status_{name}"))
+                    for name in status_fields
+                }
+        items.append(item)
+
+    next_cursor = None
+    if has_more and rows:
+        next_cursor = encode_cursor(rows[-1].sort_value, rows[-1].id)
+
+    return {"items": items, "next_cursor": next_cursor}
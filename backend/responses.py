@@ -0,0 +1,146 @@
+"""
+响应层 - 快速JSON序列化和按请求协商的压缩
+"""
+import gzip
+import json
+from datetime import datetime
+from typing import Any, Optional
+from fastapi.responses import Response
+from config import COMPRESSION_MIN_SIZE, COMPRESSION_LEVEL
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时回退到标准库 json
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只支持 gzip
+    brotli = None
+
+def _default(value: Any):
+    """标准库 json 无法处理的类型"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, RawJSON):
+        return json.loads(value.text)
+    raise TypeError(f"无法序列化类型: {type(value).__name__}")
+
+class RawJSON:
+    """数据库中已经是JSON文本的字段（如 hashboard_info），序列化时直接嵌入，避免先解析再编码"""
+
+    __slots__ = ("text", "fragment")
+
+    def __init__(self, text: Optional[str]):
+        self.text = text or "[]"
+        # orjson>=3.9 支持 Fragment，直接拼接原始JSON
+        self.fragment = orjson.Fragment(self.text) if orjson is not None and hasattr(orjson, "Fragment") else None
+
+def _orjson_default(value: Any):
+    if isinstance(value, RawJSON):
+        return value.fragment if value.fragment is not None else orjson.loads(value.text)
+    raise TypeError(f"无法序列化类型: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    """序列化为JSON字节串，datetime 直接输出为 ISO 格式"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(Response):
+    """快速JSON响应，路由直接返回此对象可以跳过 FastAPI 的 jsonable_encoder"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def _accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """根据 Accept-Encoding 选择压缩算法，优先 brotli"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """按指定算法压缩"""
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_LEVEL)
+    return gzip.compress(body, compresslevel=COMPRESSION_LEVEL)
+
+class CompressionMiddleware:
+    """响应压缩中间件（ASGI），按请求协商 br/gzip
+
+    只压缩一次性返回的响应；流式响应（如事件流）原样透传，避免缓冲。
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = _accepted_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = start_message.get("headers", [])
+            already_encoded = any(key == b"content-encoding" for key, _ in headers)
+
+            if message.get("more_body", False) or already_encoded or len(body) < self.minimum_size:
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            headers = [(key, value) for key, value in headers if key != b"content-length"]
+            headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -8,10 +8,14 @@ import os
 # 添加当前目录到路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from config import BACKEND_HOST, BACKEND_PORT
+from config import BACKEND_HOST, BACKEND_PORT, BACKEND_RELOAD
+from database import migrate
 
 if __name__ == "__main__":
     print(f"启动矿机管理系统后端服务...")
+    # 迁移步骤：表结构为最新版本时只读取一次版本号
+    migrate()
     print(f"访问地址: http://{BACKEND_HOST}:{BACKEND_PORT}")
     print(f"API文档: http://{BACKEND_HOST}:{BACKEND_PORT}/docs")
-    uvicorn.run("main:app", host=BACKEND_HOST, port=BACKEND_PORT, reload=True)
+    print(f"健康检查: http://{BACKEND_HOST}:{BACKEND_PORT}/api/health")
+    uvicorn.run("main:app", host=BACKEND_HOST, port=BACKEND_PORT, reload=BACKEND_RELOAD)
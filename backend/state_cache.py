@@ -0,0 +1,71 @@
+"""
+最新状态缓存 - 启动时用一次查询从最新状态快照（miner_latest）预热，之后由轮询任务增量更新
+"""
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy.orm import Session
+from database import Miner, MinerStatus, MinerLatest
+
+class LatestStateCache:
+    """每台矿机的在线状态和最新指标"""
+
+    def __init__(self):
+        self._states: Dict[int, Dict] = {}
+        self.warmed = False
+
+    def warm(self, db: Session):
+        """一次查询加载所有矿机及其最新状态（按快照中的状态ID主键关联，不扫描历史）"""
+        rows = db.query(
+            Miner.id,
+            Miner.is_online,
+            MinerStatus.timestamp,
+            MinerStatus.hashrate,
+            MinerStatus.hashrate_5s,
+            MinerStatus.power_consumption,
+            MinerStatus.temp_chip
+        ).select_from(Miner).outerjoin(
+            MinerLatest, MinerLatest.miner_id == Miner.id
+        ).outerjoin(
+            MinerStatus, MinerStatus.id == MinerLatest.status_id
+        ).all()
+
+        self._states = {
+            row.id: {
+                "is_online": bool(row.is_online),
+                "timestamp": row.timestamp,
+                "hashrate": row.hashrate if row.hashrate is not None else row.hashrate_5s,
+                "power_consumption": row.power_consumption,
+                "temp_chip": row.temp_chip
+            }
+            for row in rows
+        }
+        self.warmed = True
+
+    def update(self, miner_id: int, timestamp: datetime, is_online: bool, status: Optional[Dict] = None):
+        """轮询得到新样本后更新"""
+        state = self._states.setdefault(miner_id, {
+            "is_online": False, "timestamp": None, "hashrate": None,
+            "power_consumption": None, "temp_chip": None
+        })
+        state["is_online"] = bool(is_online)
+        if status:
+            hashrate = status.get("hashrate")
+            state["timestamp"] = timestamp
+            state["hashrate"] = hashrate if hashrate is not None else status.get("hashrate_5s")
+            state["power_consumption"] = status.get("power_consumption")
+            state["temp_chip"] = status.get("temp_chip")
+
+    def stats(self) -> Dict:
+        """汇总统计（在线矿机的总算力和总功耗）"""
+        total = len(self._states)
+        online = [s for s in self._states.values() if s["is_online"]]
+        return {
+            "total_miners": total,
+            "online_miners": len(online),
+            "offline_miners": total - len(online),
+            "total_hashrate": sum(s["hashrate"] or 0 for s in online),
+            "total_power": sum(s["power_consumption"] or 0 for s in online)
+        }
+
+# 全局最新状态缓存
+latest_state = LatestStateCache()
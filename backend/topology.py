@@ -0,0 +1,242 @@
+"""
+矿场拓扑 - 站点/机架/子网配置，支持热加载和按子网惰性遍历IP
+"""
+import ipaddress
+import json
+import os
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from config import (
+    TOPOLOGY_FILE, IP_RANGES, API_TIMEOUT, STATUS_UPDATE_INTERVAL,
+    DISCOVERY_CONCURRENCY, DEBUG_MODE
+)
+
+def iter_ip_range(start_ip: str, end_ip: str) -> Iterator[str]:
+    """惰性遍历IP范围（包含两端），不生成完整列表"""
+    start = int(ipaddress.IPv4Address(start_ip))
+    end = int(ipaddress.IPv4Address(end_ip))
+    for value in range(start, end + 1):
+        yield str(ipaddress.IPv4Address(value))
+
+def subtract_ranges(start: int, end: int, taken: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """从 [start, end] 中去掉已占用的区间，taken 需按起始地址排序且互不重叠"""
+    pieces = []
+    cursor = start
+    for low, high in taken:
+        if high < cursor:
+            continue
+        if low > end:
+            break
+        if low > cursor:
+            pieces.append((cursor, low - 1))
+        cursor = high + 1
+        if cursor > end:
+            break
+    if cursor <= end:
+        pieces.append((cursor, end))
+    return pieces
+
+def scan_ranges(subnets: List["Subnet"]) -> List[Tuple["Subnet", List[Tuple[int, int]]]]:
+    """按顺序去掉与前面子网重叠的部分，返回每个子网需要扫描的地址段（用整数区间计算，每个地址只扫描一次）"""
+    taken: List[Tuple[int, int]] = []
+    plan = []
+    for subnet in subnets:
+        pieces = subtract_ranges(subnet.start, subnet.end, taken)
+        if pieces:
+            plan.append((subnet, pieces))
+            taken = sorted(taken + pieces)
+    return plan
+
+class Subnet:
+    """子网：一段连续的IP地址及其扫描/轮询参数"""
+
+    def __init__(self, start: int, end: int, site: str = "default", rack: str = "default",
+                 timeout: float = API_TIMEOUT, concurrency: int = DISCOVERY_CONCURRENCY,
+                 poll_interval: int = STATUS_UPDATE_INTERVAL, name: Optional[str] = None):
+        if start > end:
+            raise ValueError("子网起始地址大于结束地址")
+        self.start = start
+        self.end = end
+        self.site = site
+        self.rack = rack
+        self.timeout = timeout
+        self.concurrency = max(1, int(concurrency))
+        self.poll_interval = max(1, int(poll_interval))
+        self.name = name or f"{ipaddress.IPv4Address(start)}-{ipaddress.IPv4Address(end)}"
+
+    @classmethod
+    def from_cidr(cls, cidr: str, **kwargs) -> "Subnet":
+        """从CIDR创建，跳过网络地址和广播地址（/31、/32 除外）"""
+        network = ipaddress.IPv4Network(cidr, strict=False)
+        start, end = int(network.network_address), int(network.broadcast_address)
+        if network.prefixlen < 31:
+            start, end = start + 1, end - 1
+        kwargs.setdefault("name", str(network))
+        return cls(start, end, **kwargs)
+
+    @classmethod
+    def from_range(cls, start_ip: str, end_ip: str, **kwargs) -> "Subnet":
+        """从起止地址创建"""
+        return cls(int(ipaddress.IPv4Address(start_ip)), int(ipaddress.IPv4Address(end_ip)), **kwargs)
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start + 1
+
+    def iter_hosts(self) -> Iterator[str]:
+        """惰性遍历子网内的地址"""
+        for value in range(self.start, self.end + 1):
+            yield str(ipaddress.IPv4Address(value))
+
+    def contains(self, ip: str) -> bool:
+        try:
+            value = int(ipaddress.IPv4Address(ip))
+        except ValueError:
+            return False
+        return self.start <= value <= self.end
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "site": self.site,
+            "rack": self.rack,
+            "start": str(ipaddress.IPv4Address(self.start)),
+            "end": str(ipaddress.IPv4Address(self.end)),
+            "size": self.size,
+            "timeout": self.timeout,
+            "concurrency": self.concurrency,
+            "poll_interval": self.poll_interval
+        }
+
+class Topology:
+    """矿场拓扑"""
+
+    def __init__(self, subnets: List[Subnet], source: str = "config"):
+        self.subnets = subnets
+        self.source = source
+        # 不属于任何子网的矿机使用默认参数
+        self.default_subnet = Subnet(0, 0, name="default")
+
+    @classmethod
+    def from_dict(cls, data: Dict, source: str = "file") -> "Topology":
+        """解析拓扑配置
+
+        格式: {"defaults": {...}, "sites": [{"name", "racks": [{"name", "subnets": [...]}]}]}
+        子网用 "cidr" 或 "range": [起始IP, 结束IP] 指定，可覆盖 timeout、concurrency、poll_interval。
+        """
+        defaults = data.get("defaults", {})
+        subnets = []
+        for site in data.get("sites", []):
+            for rack in site.get("racks", []):
+                for entry in rack.get("subnets", []):
+                    kwargs = {
+                        "site": site.get("name", "default"),
+                        "rack": rack.get("name", "default"),
+                        "timeout": float(entry.get("timeout", defaults.get("timeout", API_TIMEOUT))),
+                        "concurrency": entry.get("concurrency", defaults.get("concurrency", DISCOVERY_CONCURRENCY)),
+                        "poll_interval": entry.get("poll_interval", defaults.get("poll_interval", STATUS_UPDATE_INTERVAL)),
+                    }
+                    if entry.get("name"):
+                        kwargs["name"] = entry["name"]
+                    if "cidr" in entry:
+                        subnets.append(Subnet.from_cidr(entry["cidr"], **kwargs))
+                    elif "range" in entry:
+                        subnets.append(Subnet.from_range(entry["range"][0], entry["range"][1], **kwargs))
+                    else:
+                        raise ValueError(f"子网缺少 cidr 或 range: {entry}")
+        return cls(subnets, source=source)
+
+    @classmethod
+    def from_config(cls) -> "Topology":
+        """没有拓扑文件时，使用 config.py 中的 IP_RANGES"""
+        return cls([Subnet.from_range(start, end) for start, end in IP_RANGES], source="config")
+
+    @property
+    def size(self) -> int:
+        return sum(subnet.size for subnet in self.subnets)
+
+    @property
+    def min_poll_interval(self) -> int:
+        if not self.subnets:
+            return STATUS_UPDATE_INTERVAL
+        return min(subnet.poll_interval for subnet in self.subnets)
+
+    def subnet_for(self, ip: str) -> Subnet:
+        """查找IP所属子网"""
+        for subnet in self.subnets:
+            if subnet.contains(ip):
+                return subnet
+        return self.default_subnet
+
+    def to_dict(self) -> Dict:
+        return {
+            "source": self.source,
+            "size": self.size,
+            "min_poll_interval": self.min_poll_interval,
+            "subnets": [subnet.to_dict() for subnet in self.subnets]
+        }
+
+class TopologyManager:
+    """拓扑管理：文件修改后自动重新加载，加载失败时保留上一次的配置"""
+
+    def __init__(self, path: str = TOPOLOGY_FILE):
+        self.path = path
+        self._topology: Optional[Topology] = None
+        self._mtime: Optional[float] = None
+        self._listeners: List[Callable[[Topology], None]] = []
+        # 最近一次加载失败的原因，加载成功后清空
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[datetime] = None
+
+    def on_reload(self, listener: Callable[[Topology], None]):
+        """注册拓扑变化回调"""
+        self._listeners.append(listener)
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def reload(self, strict: bool = False) -> Topology:
+        """重新加载拓扑
+
+        加载失败时默认继续使用旧配置（自动热加载）；strict 为 True 时抛出异常（手动重新加载），
+        两种情况都会记录失败原因。
+        """
+        mtime = self._file_mtime()
+        try:
+            if mtime is None:
+                topology = Topology.from_config()
+            else:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    topology = Topology.from_dict(json.load(f), source=self.path)
+        except Exception as e:
+            self.last_error = str(e)
+            self.last_error_at = datetime.utcnow()
+            # 记录文件时间，文件再次修改前 get() 不会重复解析同一个无效文件
+            self._mtime = mtime
+            if self._topology is None or strict:
+                raise
+            if DEBUG_MODE:
+                print(f"加载拓扑配置失败，继续使用旧配置: {e}")
+            return self._topology
+
+        self.last_error = None
+        self.last_error_at = None
+        changed = self._topology is not None
+        self._topology = topology
+        self._mtime = mtime
+        if changed:
+            for listener in self._listeners:
+                listener(topology)
+        return topology
+
+    def get(self) -> Topology:
+        """获取当前拓扑（文件变化时自动重新加载）"""
+        if self._topology is None or self._file_mtime() != self._mtime:
+            return self.reload()
+        return self._topology
+
+# 全局拓扑管理器
+topology_manager = TopologyManager()
@@ -74,6 +74,58 @@ export interface LogEntry {
   source: string;
 }
 
+export interface MinerPage {
+  items: Miner[];
+  next_cursor: string | null;
+}
+
+export interface MinerQuery {
+  fields?: string;
+  online?: boolean;
+  model?: string;
+  ip_prefix?: string;
+  min_temp?: number;
+  max_temp?: number;
+  min_hashrate?: number;
+  max_hashrate?: number;
+  sort?: string;
+  cursor?: string;
+  limit?: number;
+}
+
+// 仪表板卡片需要的字段
+export const DASHBOARD_FIELDS = [
+  'ip_address', 'model', 'hostname', 'is_online',
+  'timestamp', 'hashrate_5s', 'temp_chip', 'power_consumption', 'uptime', 'pool_status',
+].join(',');
+
+export interface BulkJobRequest {
+  operation: 'reboot' | 'switch_pool' | 'add_pool' | 'set_frequency';
+  params?: Record<string, any>;
+  target: {
+    miner_ids?: number[];
+    ip_prefix?: string;
+    model?: string;
+    online?: boolean;
+    all?: boolean;
+  };
+}
+
+export interface BulkJob {
+  id: number;
+  operation: string;
+  params: Record<string, any>;
+  target: Record<string, any>;
+  status: string;
+  total: number;
+  succeeded: number;
+  failed: number;
+  pending: number;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+}
+
 export interface Stats {
   total_miners: number;
   online_miners: number;
@@ -83,11 +135,23 @@ export interface Stats {
 }
 
 export const api = {
-  getMiners: async (): Promise<Miner[]> => {
-    const response = await apiClient.get('/api/miners');
+  getMinerPage: async (query: MinerQuery = {}): Promise<MinerPage> => {
+    const response = await apiClient.get('/api/miners', { params: query });
     return response.data;
   },
 
+  // 按游标逐页获取全部矿机
+  getMiners: async (query: MinerQuery = {}): Promise<Miner[]> => {
+    const miners: Miner[] = [];
+    let cursor: string | undefined;
+    do {
+      const page = await api.getMinerPage({ limit: 1000, ...query, cursor });
+      miners.push(...page.items);
+      cursor = page.next_cursor || undefined;
+    } while (cursor);
+    return miners;
+  },
+
   getMinerDetail: async (id: number): Promise<MinerDetail> => {
     const response = await apiClient.get(`/api/miners/${id}`);
     return response.data;
@@ -107,6 +171,23 @@ export const api = {
     const response = await apiClient.get('/api/stats');
     return response.data;
   },
+
+  createJob: async (request: BulkJobRequest): Promise<BulkJob> => {
+    const response = await apiClient.post('/api/jobs', request);
+    return response.data;
+  },
+
+  getJob: async (id: number): Promise<BulkJob> => {
+    const response = await apiClient.get(`/api/jobs/${id}`);
+    return response.data;
+  },
+
+  // 订阅任务进度事件流，返回用于关闭连接的 EventSource
+  watchJob: (id: number, onProgress: (job: BulkJob) => void): EventSource => {
+    const source = new EventSource(`${API_BASE_URL}/api/jobs/${id}/events`);
+    source.onmessage = (event) => onProgress(JSON.parse(event.data));
+    return source;
+  },
 };
 
 export default apiClient;
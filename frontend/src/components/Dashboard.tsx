@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { api, Miner, Stats } from '../api/client';
+import { api, Miner, Stats, DASHBOARD_FIELDS } from '../api/client';
 import './Dashboard.css';
 
 const Dashboard: React.FC = () => {
@@ -19,7 +19,7 @@ const Dashboard: React.FC = () => {
   const loadData = async () => {
     try {
       const [minersData, statsData] = await Promise.all([
-        api.getMiners(),
+        api.getMiners({ fields: DASHBOARD_FIELDS }),
         api.getStats(),
       ]);
       setMiners(minersData);